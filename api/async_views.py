@@ -0,0 +1,238 @@
+"""
+Native async views for the hot reads of an ASGI deployment: the article
+list and detail, the comments of an article and the auth check.
+
+AsyncRoutesMiddleware puts them (final/urls_async.py) in front of the
+regular routes when the request is served async, so a WSGI deployment
+never runs them. They answer the JSON GETs with the async ORM, the
+async cache API and a JWT authentication whose user lookup is awaited;
+roles are loaded with aget_roles() before any permission check, which
+then runs on the memoized roles. Everything else - writes, ?search=
+(the search backends are sync), ?tree=, the browsable API, ?format= -
+goes to the regular view of the route, in a thread.
+
+The responses are the same as the regular views' (see
+AsyncViewTests), and use the same response cache and ETags.
+"""
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed, ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import acached_response, comments_namespace, detail_namespace, list_namespace
+from .log import fields, lazy
+from .models import Article, Comment
+from .pagination import CommentPagination
+from .permissions import aget_roles, get_roles
+from .renderers import FastJSONRenderer
+from .serialiazers import ArticleValuesSerializer, CommentValuesSerializer
+from .views import ArticleViewSet
+
+logger = logging.getLogger(__name__)
+
+ASYNC_URLCONF = 'final.urls_async'
+
+jwt = JWTAuthentication()
+renderer = FastJSONRenderer()
+
+
+class AsyncRoutesMiddleware:
+    """
+    Route the requests served async (ASGI) to the async views, unless
+    settings.API_ASYNC_VIEWS is off; sync requests keep the regular routes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_ASYNC_VIEWS', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.urlconf = ASYNC_URLCONF
+        return await self.get_response(request)
+
+
+def async_view(handler, sync_view, delegated=()):
+    """
+    The async view of a route: `handler(request, **kwargs)` answers its
+    JSON GETs, with a DRF Request (authenticated, roles loaded) and
+    returns a Response; the other requests, and those with one of the
+    `delegated` parameters, go to `sync_view`.
+    """
+    delegate = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if not serves(request, delegated):
+            return await delegate(request, *args, **kwargs)
+        try:
+            request = await authenticate(request)
+            response = await handler(request, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            response = handle_exception(exc, request)
+        return render(response)
+
+    view.csrf_exempt = True
+    view.__name__ = view.__qualname__ = handler.__name__
+    return view
+
+
+def serves(request, delegated):
+    """Whether the request is a GET the async views answer"""
+    if request.method != 'GET' or 'format' in request.GET or any(param in request.GET for param in delegated):
+        return False
+    # the browsable API
+    return 'text/html' not in request.headers.get('Accept', '') and request.accepts('application/json')
+
+
+async def authenticate(request):
+    """
+    JWTAuthentication.authenticate() with the user looked up async, as a
+    DRF Request. Raises AuthenticationFailed like the regular views do.
+    """
+    request = Request(request)
+    user, token = AnonymousUser(), None
+    header = jwt.get_header(request)
+    raw_token = None if header is None else jwt.get_raw_token(header)
+    if raw_token is not None:
+        token = jwt.get_validated_token(raw_token)
+        user = await aget_user(token)
+    request.user, request.auth = user, token
+    await aget_roles(user, token)
+    return request
+
+
+async def aget_user(token):
+    # JWTAuthentication.get_user()
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise AuthenticationFailed('Token contained no recognizable user identification', code='token_not_valid')
+    try:
+        user = await jwt.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except jwt.user_model.DoesNotExist:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN and \
+            token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+    return user
+
+
+def handle_exception(exc, request):
+    # APIView.handle_exception()
+    if isinstance(exc, AuthenticationFailed):
+        exc.auth_header = jwt.authenticate_header(request)
+    response = exception_handler(exc, {'request': request, 'view': None})
+    if response is None:
+        raise exc
+    return response
+
+
+def render(response):
+    """
+    The JSON of a Response, rendered here rather than by the handler
+    (which would render it in a thread).
+    """
+    if not isinstance(response, Response):
+        return response
+    content = renderer.render(response.data) if response.data is not None else b''
+    rendered = HttpResponse(content, status=response.status_code, content_type=renderer.media_type)
+    for header, value in response.items():
+        if header != 'Content-Type':
+            rendered[header] = value
+    patch_vary_headers(rendered, ['Accept'])
+    return rendered
+
+
+def article_view(request, action, **kwargs):
+    """An ArticleViewSet for its get_queryset() and ETag helpers"""
+    view = ArticleViewSet(request=request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+    view.check_permissions(request)
+    return view
+
+
+async def article_or_404(queryset, pk):
+    # DRF's get_object_or_404()
+    try:
+        row = await queryset.filter(pk=pk).afirst()
+    except (TypeError, ValueError, DjangoValidationError):
+        raise Http404
+    if row is None:
+        raise Http404(f'No {Article._meta.object_name} matches the given query.')
+    return row
+
+
+async def page(request, queryset, serializer_class, paginator):
+    rows = await paginator.apaginate_queryset(serializer_class.values(queryset), request)
+    return paginator.get_paginated_response(serializer_class(rows, many=True).data)
+
+
+async def article_list(request):
+    view = article_view(request, 'list')
+
+    async def respond():
+        queryset = view.filter_queryset(view.get_queryset())
+        etag = view.make_etag(request.get_full_path(), *(await view.alist_state(queryset)).values())
+        return await view.aconditional(request, etag, None,
+                                       lambda: page(request, queryset, ArticleValuesSerializer, view.paginator))
+
+    return await acached_response(request, list_namespace(), respond)
+
+
+async def article_detail(request, pk):
+    view = article_view(request, 'retrieve', pk=pk)
+
+    async def respond():
+        # the list's values() row, the same output as ArticleSerializer
+        row = await article_or_404(ArticleValuesSerializer.values(view.get_queryset()), pk)
+        validators = view.validators([row['id'], row['updated_at']])
+        return view.conditional(request, *validators, lambda: Response(ArticleValuesSerializer([row]).data[0]))
+
+    return await acached_response(request, detail_namespace(pk), respond)
+
+
+async def article_comments(request, pk):
+    view = article_view(request, 'comments', pk=pk)
+    logger.debug('Comments of article %s', pk, extra=fields(
+        method=request.method, user=request.user.username,
+        roles=lazy(lambda: sorted(get_roles(request.user, request.auth))),
+    ))
+
+    async def respond():
+        article = await article_or_404(view.get_queryset().values('pk'), pk)
+        comments = Comment.objects.filter(article=article['pk'])
+        state = await view.alist_state(comments)
+        etag = view.make_etag(request.get_full_path(), *state.values())
+        return await view.aconditional(request, etag, None,
+                                       lambda: page(request, comments, CommentValuesSerializer, CommentPagination()))
+
+    return await acached_response(request, comments_namespace(pk), respond)
+
+
+async def auth_check(request):
+    """AuthViewSet.auth()"""
+    if request.user.is_authenticated:
+        return Response({'authenticated': True, 'user': request.user.username})
+    return Response({'authenticated': False}, status=401)
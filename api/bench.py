@@ -0,0 +1,70 @@
+"""
+Helpers for the benchmark management commands (bench_*). The benchmarks
+run in-process against a throwaway test database, never against the
+configured one.
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def throwaway_database(on_disk=False):
+    """
+    Run the block against a freshly migrated test database (in memory for
+    SQLite, unless `on_disk`) that is destroyed afterwards.
+    """
+    test_settings = connection.settings_dict['TEST']
+    old_test_name, directory = test_settings['NAME'], None
+    if on_disk and connection.vendor == 'sqlite' and not old_test_name:
+        directory = tempfile.mkdtemp(prefix='bench-')
+        test_settings['NAME'] = os.path.join(directory, 'test.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        test_settings['NAME'] = old_test_name
+        if directory is not None:
+            # with the -wal and -shm files
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def measure(func, repeat, setup=None):
+    """
+    Call `func` `repeat` times, return the latencies in milliseconds.
+    `setup` runs before every call, untimed.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    """
+    Median and tail percentiles of a list of latencies.
+    """
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'p50': round(statistics.median(ordered), 3),
+        'p95': round(percentile(95), 3),
+        'p99': round(percentile(99), 3),
+        'max': round(ordered[-1], 3),
+    }
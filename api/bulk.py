@@ -0,0 +1,227 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+
+class BulkMixin:
+    """
+    `<resource>/bulk/`: many objects in one request and one transaction.
+
+        POST    [{...}, {...}]              create
+        PATCH   [{"id": 1, ...}, ...]       partial update
+        DELETE  [1, 2, ...]                 delete
+
+    The permissions of the view are checked once, the items are validated
+    one after the other by a single serializer (its fields are built once)
+    and the valid ones are written with bulk_create / bulk_update. The
+    response has the outcome of every item, in the order given; an invalid
+    item does not stop the others (207 when some failed).
+
+    bulk_create / bulk_update send no model signals, `bulk_written()` does
+    what the receivers in api.signals would have done.
+    """
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        maximum = getattr(settings, 'API_BULK_MAX_ITEMS', 1000)
+        if len(items) > maximum:
+            raise ValidationError({'non_field_errors': [f'At most {maximum} items per request.']})
+
+        handler = {'POST': self.create_many, 'PATCH': self.update_many, 'DELETE': self.destroy_many}
+        with transaction.atomic():
+            results = handler[request.method](items)
+
+        failed = sum(1 for result in results if 'errors' in result)
+        if failed:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+        return Response({'results': results, 'failed': failed}, status=code)
+
+    def create_many(self, items):
+        serializer = self.get_serializer(data=items, many=True)
+        model = serializer.child.Meta.model
+        results, valid = [None] * len(items), {}
+        seen = self.unique_keys(model)
+
+        for index, item in enumerate(items):
+            try:
+                attrs = serializer.child.run_validation(item)
+            except ValidationError as exc:
+                results[index] = self.error(status.HTTP_400_BAD_REQUEST, exc.detail)
+                continue
+            m2m = self.pop_m2m(model, attrs)
+            instance = model(**attrs)
+            duplicate = self.duplicate(seen, instance)
+            if duplicate is not None:
+                results[index] = self.error(status.HTTP_400_BAD_REQUEST, duplicate)
+                continue
+            valid[index] = (instance, m2m)
+
+        created = model._default_manager.bulk_create([instance for instance, _ in valid.values()])
+        self.set_m2m(model, [(instance, m2m) for instance, m2m in valid.values()])
+        self.bulk_written(created, created=True)
+
+        data = self.serialize([instance.pk for instance in created])
+        for index, (instance, _) in valid.items():
+            results[index] = {'id': instance.pk, 'status': status.HTTP_201_CREATED, 'data': data[instance.pk]}
+        return results
+
+    def update_many(self, items):
+        serializer = self.get_serializer(data=items, many=True, partial=True)
+        model = serializer.child.Meta.model
+        instances = self.get_queryset().in_bulk(
+            [item['id'] for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)]
+        )
+        results, valid, fields = [None] * len(items), {}, set()
+        seen = self.unique_keys(model)
+
+        for index, item in enumerate(items):
+            instance = self.instance_of(item.get('id') if isinstance(item, dict) else None, instances)
+            if isinstance(instance, dict):
+                results[index] = instance
+                continue
+            if instance.pk in seen['pk']:
+                results[index] = self.error(status.HTTP_400_BAD_REQUEST, {'id': ['Given more than once.']})
+                continue
+            serializer.child.instance = instance
+            try:
+                attrs = serializer.child.run_validation(item)
+            except ValidationError as exc:
+                results[index] = self.error(status.HTTP_400_BAD_REQUEST, exc.detail)
+                continue
+            m2m = self.pop_m2m(model, attrs)
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            duplicate = self.duplicate(seen, instance)
+            if duplicate is not None:
+                results[index] = self.error(status.HTTP_400_BAD_REQUEST, duplicate)
+                continue
+            seen['pk'].add(instance.pk)
+            valid[index] = (instance, m2m)
+
+        updated = [instance for instance, _ in valid.values()]
+        # auto_now fields, which bulk_update leaves alone
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                for instance in updated:
+                    field.pre_save(instance, add=False)
+                fields.add(field.name)
+        if updated:
+            model._default_manager.bulk_update(updated, sorted(fields))
+        self.set_m2m(model, [(instance, m2m) for instance, m2m in valid.values()], replace=True)
+        self.bulk_written(updated, created=False)
+
+        data = self.serialize([instance.pk for instance in updated])
+        for index, (instance, _) in valid.items():
+            results[index] = {'id': instance.pk, 'status': status.HTTP_200_OK, 'data': data[instance.pk]}
+        return results
+
+    def destroy_many(self, items):
+        instances = self.get_queryset().in_bulk([pk for pk in items if isinstance(pk, int)])
+        results, deleted = [], set()
+        for pk in items:
+            instance = self.instance_of(pk, instances)
+            if isinstance(instance, dict):
+                results.append(instance)
+            elif instance.pk in deleted:
+                results.append(self.error(status.HTTP_400_BAD_REQUEST, {'id': ['Given more than once.']}))
+            else:
+                deleted.add(instance.pk)
+                results.append({'id': instance.pk, 'status': status.HTTP_204_NO_CONTENT})
+        # a queryset delete still sends the delete signals, nothing else to do
+        if deleted:
+            self.get_queryset().filter(pk__in=deleted).delete()
+        return results
+
+    def bulk_written(self, instances, created):
+        """
+        Called with the instances written by bulk_create (`created`) or
+        bulk_update, inside the transaction.
+        """
+
+    def instance_of(self, pk, instances):
+        """
+        The instance with primary key `pk` if the user may change it,
+        otherwise the error result of the item.
+        """
+        if not isinstance(pk, int):
+            return self.error(status.HTTP_400_BAD_REQUEST, {'id': ['A valid integer is required.']})
+        if pk not in instances:
+            return self.error(status.HTTP_404_NOT_FOUND, {'detail': 'No such object.'})
+        try:
+            self.check_object_permissions(self.request, instances[pk])
+        except PermissionDenied as exc:
+            return self.error(status.HTTP_403_FORBIDDEN, {'detail': exc.detail})
+        return instances[pk]
+
+    def serialize(self, pks):
+        objects = self.get_queryset().filter(pk__in=pks)
+        return {item['id']: item for item in self.get_serializer(objects, many=True).data}
+
+    @staticmethod
+    def error(code, detail):
+        return {'status': code, 'errors': detail}
+
+    @staticmethod
+    def pop_m2m(model, attrs):
+        return {name: attrs.pop(name) for name in list(attrs)
+                if model._meta.get_field(name).many_to_many}
+
+    @staticmethod
+    def set_m2m(model, instances, replace=False):
+        """
+        Write the many-to-many values of the instances with one bulk insert
+        per relation (and one delete first, when replacing).
+        """
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            source, target = field.m2m_column_name(), field.m2m_reverse_name()
+            changed = [(instance, m2m[field.name]) for instance, m2m in instances if field.name in m2m]
+            if not changed:
+                continue
+            if replace:
+                through.objects.filter(**{f'{source}__in': [instance.pk for instance, _ in changed]}).delete()
+            through.objects.bulk_create([
+                through(**{source: instance.pk, target: related.pk})
+                for instance, related_objects in changed for related in set(related_objects)
+            ])
+
+    @staticmethod
+    def unique_keys(model):
+        """
+        The unique fields (and field sets) of `model`, each with the values
+        seen so far in this request.
+        """
+        constraints = [(field.name,) for field in model._meta.concrete_fields if field.unique and not field.primary_key]
+        constraints += [tuple(names) for names in model._meta.unique_together]
+        seen = {constraint: set() for constraint in constraints}
+        seen['pk'] = set()
+        return seen
+
+    @staticmethod
+    def duplicate(seen, instance):
+        """
+        The error of an instance clashing with an earlier item of the same
+        request, which the serializer's unique validators cannot see.
+        """
+        keys = {}
+        for constraint, values in seen.items():
+            if constraint == 'pk':
+                continue
+            key = tuple(getattr(instance, instance._meta.get_field(name).attname) for name in constraint)
+            if key in values:
+                return {'non_field_errors': [f'{", ".join(constraint)} given more than once.']}
+            keys[constraint] = key
+        for constraint, key in keys.items():
+            seen[constraint].add(key)
+        return None
@@ -0,0 +1,171 @@
+import uuid
+from collections import Counter
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from .conditional import ConditionalGetMixin
+from .filters import ArticleSearchFilter
+from .routers import primary
+from .search import get_search_backend
+
+# Anonymous article responses (the list and its ?search= variants, the
+# detail and the comments of an article) are cached under versioned keys:
+#
+#     api:articles:<namespace>:<version>:<request hash>
+#
+# Invalidation never looks for entries, it replaces the version of the
+# namespace (from api.signals) and the old entries are simply never read
+# again. Versions are random tokens, so an evicted version cannot bring
+# stale entries back.
+
+VERSION_KEY = 'api:articles:version:{}'
+ENTRY_KEY = 'api:articles:{}:{}:{}'
+
+# hits and misses of this process, per namespace kind ('list', 'detail', 'comments')
+stats = Counter()
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def list_namespace():
+    return 'list'
+
+
+def article_namespace(kind, article_id):
+    # ids come from the url as well, '05' is article 5
+    try:
+        return f'{kind}:{int(article_id)}'
+    except ValueError:
+        return None
+
+
+def detail_namespace(article_id):
+    return article_namespace('detail', article_id)
+
+
+def comments_namespace(article_id):
+    return article_namespace('comments', article_id)
+
+
+def invalidate(*namespaces):
+    def bump():
+        get_cache().set_many({VERSION_KEY.format(namespace): uuid.uuid4().hex for namespace in namespaces}, None)
+
+    # now, and again once committed: a read between the two could cache
+    # the data from before the transaction
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_articles(article_ids=()):
+    """
+    After a change to the given articles: their details and every list.
+    """
+    invalidate(list_namespace(), *(detail_namespace(article_id) for article_id in article_ids))
+
+
+def request_hash(request):
+    """
+    The request, normalized: the search terms as the search backend reads
+    them (see LikeSearchBackend.normalize), the other parameters sorted.
+    """
+    params = []
+    for name in sorted(request.query_params):
+        values = request.query_params.getlist(name)
+        if name == 'search':
+            values = get_search_backend().normalize(ArticleSearchFilter().get_search_terms(request))
+        params.append((name, values))
+    return md5(repr((request.get_host(), params)).encode(), usedforsecurity=False).hexdigest()
+
+
+def cacheable(request, namespace):
+    return namespace is not None and request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def cached_response(request, namespace, respond):
+    """
+    The cached response of an anonymous GET, or `respond()` (stored for
+    the next time). Cached entries keep their ETag and are answered 304
+    as usual.
+    """
+    if not cacheable(request, namespace):
+        return respond()
+
+    cache = get_cache()
+    version_key = VERSION_KEY.format(namespace)
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(version_key, version, None)
+        version = cache.get(version_key, version)
+    key = ENTRY_KEY.format(namespace, version, request_hash(request))
+
+    entry = cache.get(key)
+    if entry is not None:
+        return hit(request, namespace, entry)
+
+    # from the primary: a lagging replica would cache the old data under the new version
+    with primary():
+        response = miss(namespace, respond())
+    entry = entry_of(response)
+    if entry is not None:
+        cache.set(key, entry, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return response
+
+
+async def acached_response(request, namespace, respond):
+    """
+    cached_response() for the async views (see api.async_views), with an
+    async `respond`.
+    """
+    if not cacheable(request, namespace):
+        return await respond()
+
+    cache = get_cache()
+    version_key = VERSION_KEY.format(namespace)
+    version = await cache.aget(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        await cache.aadd(version_key, version, None)
+        version = await cache.aget(version_key, version)
+    key = ENTRY_KEY.format(namespace, version, request_hash(request))
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        return hit(request, namespace, entry)
+
+    with primary():
+        response = miss(namespace, await respond())
+    entry = entry_of(response)
+    if entry is not None:
+        await cache.aset(key, entry, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return response
+
+
+def hit(request, namespace, entry):
+    kind = namespace.split(':')[0]
+    stats[f'{kind}_hit'] += 1
+    data, etag = entry
+    response = ConditionalGetMixin.conditional(request, etag, None, lambda: Response(data))
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def miss(namespace, response):
+    kind = namespace.split(':')[0]
+    stats[f'{kind}_miss'] += 1
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def entry_of(response):
+    """What is cached of a response: its data and ETag, if it has them"""
+    if response.status_code == 200 and response.has_header('ETag'):
+        return response.data, response['ETag']
+    return None
@@ -0,0 +1,108 @@
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for the ModelViewSets whose models carry
+    an `updated_at`.
+
+    A GET with If-None-Match / If-Modified-Since is answered 304 from a
+    cheap `values()` lookup (detail; after get_object() when the
+    permissions check the object) or aggregate (list), before anything is
+    serialized. The list ETag is built from max(updated_at) plus the
+    row count, so that deletions change it too; lists send no
+    Last-Modified because a deletion does not move it.
+
+    Every write that changes the representation has to move updated_at,
+    the queryset update()s that skip auto_now included (see the like
+    counters and tags in api.signals).
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        conditional = request.headers.get('If-None-Match') or request.headers.get('If-Modified-Since')
+        # the shortcut skips get_object(), so only without object permissions to check
+        if conditional and not self.checks_object_permissions():
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            state = (self.get_queryset().prefetch_related(None)
+                     .filter(**{self.lookup_field: kwargs[lookup]})
+                     .values('pk', 'updated_at').first())
+            # a missing object goes the regular way, to its 404
+            if state is not None:
+                response = self.conditional(request, *self.validators(state.values()), lambda: None)
+                if response is not None:
+                    return response
+
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        values = [instance.pk, instance.updated_at]
+        return self.conditional(request, *self.validators(values), lambda: Response(serializer.data))
+
+    def checks_object_permissions(self):
+        return any(type(permission).has_object_permission is not BasePermission.has_object_permission
+                   for permission in self.get_permissions())
+
+    def validators(self, values):
+        """
+        ETag and Last-Modified of an object from its pk and updated_at.
+        """
+        pk, updated_at = values
+        return self.make_etag(pk, updated_at), int(updated_at.timestamp())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = self.make_etag(request.get_full_path(), *self.list_state(queryset).values())
+        return self.conditional(request, etag, None,
+                                lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def list_state(self, queryset):
+        """
+        One aggregate query over every row of the (filtered) list.
+        """
+        return queryset.prefetch_related(None).order_by().aggregate(**self.list_aggregates())
+
+    async def alist_state(self, queryset):
+        return await queryset.prefetch_related(None).order_by().aaggregate(**self.list_aggregates())
+
+    @staticmethod
+    def list_aggregates():
+        return {'count': Count('pk'), 'updated_at': Max('updated_at')}
+
+    @staticmethod
+    def make_etag(*values):
+        return quote_etag(md5(repr(values).encode(), usedforsecurity=False).hexdigest())
+
+    @staticmethod
+    def conditional(request, etag, last_modified, respond):
+        """
+        304 if the client's copy is current, otherwise `respond()`, with the
+        validators attached.
+        """
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond()
+        return ConditionalGetMixin.add_validators(response, etag, last_modified)
+
+    @staticmethod
+    async def aconditional(request, etag, last_modified, respond):
+        """conditional() with an async `respond`"""
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await respond()
+        return ConditionalGetMixin.add_validators(response, etag, last_modified)
+
+    @staticmethod
+    def add_validators(response, etag, last_modified):
+        if response is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # cacheable, but check back every time; per user (the JWT)
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+        return response
@@ -0,0 +1,43 @@
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from .search import get_search_backend
+
+
+class ArticleSearchFilter(filters.SearchFilter):
+    """
+    `?search=` for articles, searched by the configured backend (see
+    api.search): with a full-text one the results are ranked by relevance,
+    otherwise the like backend matches the terms with LIKE.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
+
+
+class ArticleTagFilter(filters.BaseFilterBackend):
+    """
+    `?tag=python&tag=django`: the articles with all of the tags, or with any
+    of them with `?tag_match=any`. Tag names match exactly.
+    """
+    matches = ('all', 'any')
+
+    def filter_queryset(self, request, queryset, view):
+        names = sorted(set(filter(None, request.query_params.getlist('tag'))))
+        if not names:
+            return queryset
+        match = request.query_params.get('tag_match', 'all')
+        if match not in self.matches:
+            raise ValidationError({'tag_match': [f'Must be one of {", ".join(self.matches)}.']})
+
+        if match == 'any' and len(names) > 1:
+            # IN (the tagged articles): a join would repeat the articles with several of the tags
+            tagged = queryset.model.tags.through.objects.filter(tag__name__in=names).values('article_id')
+            return queryset.filter(id__in=tagged)
+        # a join per tag, each matching at most one row per article: no duplicates, no DISTINCT
+        for name in names:
+            queryset = queryset.filter(tags__name=name)
+        return queryset
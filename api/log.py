@@ -0,0 +1,180 @@
+"""
+Structured logging for the api (configured by LOGGING in final/settings.py).
+
+Log calls take their context as fields, computed only if the record is
+emitted:
+
+    logger.debug('Comment created', extra=fields(article=article.id,
+                                                 roles=lazy(lambda: sorted(get_roles(user)))))
+
+A disabled level costs the call and nothing else: `lazy` values (queries,
+serializer errors, request bodies) are evaluated by the formatter. Records
+carry the id of their request (RequestIdMiddleware, the X-Request-ID
+header), are written as text or JSON lines, and below WARNING can be
+sampled per logger (SamplingFilter).
+"""
+import json
+import logging
+import random
+import re
+import uuid
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+_request_id = ContextVar('api_request_id', default='-')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# ids given by a client or a proxy are kept if they look like ids
+VALID_REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+
+
+class lazy:
+    """
+    A field value computed when (and each time) the record is formatted.
+    """
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+def fields(**values):
+    """The `extra` of a log call with structured fields"""
+    return {'fields': values}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def resolve(value):
+    return value.func() if isinstance(value, lazy) else value
+
+
+class RequestIdMiddleware:
+    """
+    Give every request an id (the X-Request-ID it came with, or a new
+    one), set on the log records of the request and on the response.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _request_id.set(self.request_id(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.id
+        return response
+
+    async def __acall__(self, request):
+        token = _request_id.set(self.request_id(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.id
+        return response
+
+    @staticmethod
+    def request_id(request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.id = request_id
+        return request_id
+
+
+class RequestIdFilter(logging.Filter):
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a share of the records below WARNING of some loggers: `rates` maps
+    logger names (and their children) to the share kept, e.g.
+    {'api.views': 0.1} or 'api.views=0.1' (the LOG_SAMPLING variable).
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = parse_rates(rates) if isinstance(rates, str) else dict(rates or {})
+        self.cache = {}
+
+    def rate(self, name):
+        if name not in self.cache:
+            rate, parts = 1.0, name.split('.')
+            # the most specific logger with a rate
+            for end in range(len(parts), 0, -1):
+                prefix = '.'.join(parts[:end])
+                if prefix in self.rates:
+                    rate = float(self.rates[prefix])
+                    break
+            self.cache[name] = rate
+        return self.cache[name]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+def parse_rates(value):
+    """'api.views=0.1,api.permissions=0.01' as a dict"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The usual line, then the fields as key=value.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        values = getattr(record, 'fields', None)
+        if values:
+            line += ' ' + ' '.join(f'{key}={resolve(value)!r}' for key, value in values.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message, request_id,
+    the fields, and the exception if any.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', get_request_id()),
+        }
+        for key, value in (getattr(record, 'fields', None) or {}).items():
+            entry[key] = resolve(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,322 @@
+import itertools
+import json
+import logging
+import platform
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import django
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api import urls
+from api.bench import measure, summarize, throwaway_database
+from api.caching import comments_namespace, detail_namespace, invalidate, list_namespace
+from api.models import Article, ArticleUserLikes, Comment, Tag, UserProfile
+from api.synthetic import PASSWORD, generate
+from core.auth import get_token_for_user
+
+# routes outside api/urls.py that the suite covers too
+EXTRA_ROUTES = {'token_obtain_pair', 'token_refresh'}
+
+
+class Scenario:
+    """
+    One request of the suite. `path` is formatted with the context of the
+    dataset (ids, see Command.context), `data` is called with it for the
+    JSON body; `setup` runs before every request, untimed (emptying the
+    cache, recreating what the request deletes).
+    """
+
+    def __init__(self, name, route, path, method='get', user=None, data=None, status=200, setup=None,
+                 repeat=None):
+        self.name = name
+        self.route = route
+        self.path = path
+        self.method = method
+        self.user = user
+        self.data = data
+        self.status = status
+        self.setup = setup
+        # at most this many requests, for the slow ones (password hashing, exports)
+        self.repeat = repeat
+
+
+def cold(context):
+    # anonymous reads would be answered from the response cache
+    invalidate(list_namespace(), detail_namespace(context['hot']), comments_namespace(context['hot']))
+
+
+def doomed_article(context):
+    context['doomed'] = Article.objects.create(
+        author_id=context['editor_profile'], title=f'Doomed article {context["unique"]()}',
+        text='About to be deleted', status='published',
+    ).id
+
+
+def unlike(context):
+    ArticleUserLikes.objects.filter(user_id=context['reader_profile'], article_id__in=context['unliked']).delete()
+
+
+def article(context, prefix):
+    return {'title': f'{prefix} {context["unique"]()}', 'text': 'A benchmark article ' * 20,
+            'status': 'published', 'tags': [context['tag']]}
+
+
+SCENARIOS = [
+    Scenario('root', 'api-root', '/api/', user='reader'),
+    # articles
+    Scenario('articles.list', 'articles-list', '/api/articles/', setup=cold),
+    Scenario('articles.list.cached', 'articles-list', '/api/articles/'),
+    Scenario('articles.list.next_page', 'articles-list', '{next_page}', setup=cold),
+    Scenario('articles.list.editor_all', 'articles-list', '/api/articles/?status=all', user='editor'),
+    Scenario('articles.search', 'articles-list', '/api/articles/?search=python', setup=cold),
+    Scenario('articles.tags', 'articles-list', '/api/articles/?tag={tag_names[0]}&tag={tag_names[1]}&tag_match=any',
+             setup=cold),
+    Scenario('articles.search.terms', 'articles-list', '/api/articles/?search=replica%20pool', setup=cold),
+    Scenario('articles.create', 'articles-list', '/api/articles/', 'post', 'editor',
+             lambda context: article(context, 'Benchmark article'), status=201),
+    Scenario('articles.retrieve', 'articles-detail', '/api/articles/{hot}/', setup=cold),
+    Scenario('articles.update', 'articles-detail', '/api/articles/{own}/', 'patch', 'editor',
+             lambda context: {'text': f'Updated text {context["unique"]()}'}),
+    Scenario('articles.delete', 'articles-detail', '/api/articles/{doomed}/', 'delete', 'editor',
+             status=204, setup=doomed_article),
+    Scenario('articles.comments', 'articles-comments', '/api/articles/{hot}/comments/', setup=cold),
+    Scenario('articles.comments.tree', 'articles-comments', '/api/articles/{hot}/comments/?tree=1', setup=cold),
+    Scenario('articles.comments.create', 'articles-comments', '/api/articles/{hot}/comments/', 'post', 'reader',
+             lambda context: {'text': 'A benchmark comment'}, status=201),
+    Scenario('articles.export', 'articles-export', '/api/articles/export/', user='editor', repeat=3),
+    Scenario('articles.bulk', 'articles-bulk', '/api/articles/bulk/', 'post', 'editor',
+             lambda context: [article(context, 'Bulk article') for _ in range(20)], status=201),
+    Scenario('articles.trending', 'articles-trending', '/api/articles/trending/'),
+    Scenario('articles.cache_stats', 'articles-cache-stats', '/api/articles/cache_stats/', user='admin'),
+    Scenario('metrics', 'metrics', '/api/_metrics', user='admin'),
+    Scenario('health', 'health', '/api/_health'),
+    # comments
+    Scenario('comments.list', 'comments-list', '/api/comments/'),
+    Scenario('comments.retrieve', 'comments-detail', '/api/comments/{comment}/'),
+    # tags
+    Scenario('tags.list', 'tags-list', '/api/tags/'),
+    Scenario('tags.retrieve', 'tags-detail', '/api/tags/{tag}/'),
+    Scenario('tags.cloud', 'tags-cloud', '/api/tags/cloud/'),
+    Scenario('tags.bulk', 'tags-bulk', '/api/tags/bulk/', 'post', 'editor',
+             lambda context: [{'name': f'bench-{context["unique"]()}'} for _ in range(20)], status=201),
+    # likes
+    Scenario('likes.list', 'likes-list', '/api/likes/'),
+    Scenario('likes.retrieve', 'likes-detail', '/api/likes/{like}/', user='admin'),
+    Scenario('likes.create', 'likes-list', '/api/likes/', 'post', 'reader',
+             lambda context: {'article': context['unliked'][0], 'like_type': 'like'}, status=201, setup=unlike),
+    Scenario('likes.bulk', 'likes-bulk', '/api/likes/bulk/', 'post', 'reader',
+             lambda context: [{'article': article_id, 'like_type': 'dislike'} for article_id in context['unliked']],
+             status=201, setup=unlike),
+    # users
+    Scenario('users.list', 'users-list', '/api/users/', user='admin', repeat=5),
+    Scenario('users.retrieve', 'users-detail', '/api/users/{reader}/', user='admin'),
+    Scenario('userprofiles.list', 'userprofiles-list', '/api/userprofiles/', repeat=5),
+    Scenario('userprofiles.retrieve', 'userprofiles-detail', '/api/userprofiles/{reader_profile}/', user='reader'),
+    # authentication, most of it is hashing the password
+    Scenario('auth', 'auth-list', '/api/auth/'),
+    Scenario('auth.check', 'auth-auth', '/api/auth/auth/', user='reader'),
+    Scenario('auth.login', 'auth-login', '/api/auth/login/', 'post',
+             data=lambda context: {'username': context['reader_name'], 'password': PASSWORD}, repeat=5),
+    Scenario('auth.register', 'auth-register', '/api/auth/register/', 'post',
+             data=lambda context: {'username': f'bench_user_{context["unique"]()}', 'password': PASSWORD},
+             repeat=5),
+    Scenario('login', 'login', '/api/login/', 'post',
+             data=lambda context: {'username': context['reader_name'], 'password': PASSWORD}, repeat=5),
+    Scenario('register', 'register', '/api/register/', 'post',
+             data=lambda context: {'username': f'bench_user_{context["unique"]()}', 'password': PASSWORD},
+             repeat=5),
+    Scenario('token', 'token_obtain_pair', '/api/token/', 'post',
+             data=lambda context: {'username': context['reader_name'], 'password': PASSWORD}, repeat=5),
+    Scenario('token.refresh', 'token_refresh', '/api/token/refresh/', 'post',
+             data=lambda context: {'refresh': context['refresh']}),
+]
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """
+    The names of the routes no scenario requests.
+    """
+    routes = {pattern.name for pattern in urls.urlpatterns} | EXTRA_ROUTES
+    return routes - {scenario.route for scenario in scenarios}
+
+
+@contextmanager
+def quiet_requests():
+    logger = logging.getLogger('django.request')
+    disabled, logger.disabled = logger.disabled, True
+    try:
+        yield
+    finally:
+        logger.disabled = disabled
+
+
+def regressions(baseline, current, threshold, min_ms):
+    """
+    (size, scenario, what) of every result worse than the baseline: p50 or
+    p95 slower by more than `threshold` percent (and `min_ms`), more
+    queries, `threshold` percent more bytes, or another status.
+    """
+    found = []
+    for size, results in current['results'].items():
+        for name, result in results.items():
+            before = baseline['results'].get(size, {}).get(name)
+            if before is None:
+                continue
+            for key in ('p50', 'p95'):
+                if result[key] > before[key] * (1 + threshold / 100) and result[key] - before[key] > min_ms:
+                    found.append((size, name, f'{key} {before[key]:.2f} -> {result[key]:.2f} ms'))
+            if result['queries'] > before['queries']:
+                found.append((size, name, f'queries {before["queries"]} -> {result["queries"]}'))
+            if result['bytes'] > before['bytes'] * (1 + threshold / 100):
+                found.append((size, name, f'bytes {before["bytes"]} -> {result["bytes"]}'))
+            if result['status'] != before['status']:
+                found.append((size, name, f'status {before["status"]} -> {result["status"]}'))
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every API route in-process on generated datasets: latency percentiles, queries '
+            'and bytes per request; save a JSON baseline or compare with one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000], help='Articles per dataset')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--only', nargs='+', help='Scenarios starting with these names')
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to compare with, fails on regressions')
+        parser.add_argument('--threshold', type=float, default=20, help='Percent slower or larger that counts')
+        parser.add_argument('--min-ms', type=float, default=1, help='Latency differences below this are noise')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read the baseline: {exc}')
+
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['only'] or scenario.name.startswith(tuple(options['only']))]
+        missing = uncovered_routes()
+        if missing:
+            self.stdout.write(self.style.WARNING(f'No scenario for {", ".join(sorted(missing))}'))
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+            },
+            'results': {},
+        }
+        for size in sorted(options['sizes']):
+            with throwaway_database():
+                cache.clear()
+                generate(users=max(20, size // 10), articles=size, seed=options['seed'])
+                context = self.context()
+                results = report['results'][str(size)] = {}
+                for scenario in scenarios:
+                    results[scenario.name] = result = self.run(scenario, context, options['repeat'])
+                    self.stdout.write(
+                        f'{size:>7} articles  {scenario.name:<28} {result["status"]}  '
+                        f'p50 {result["p50"]:>8.2f} ms  p95 {result["p95"]:>8.2f} ms  '
+                        f'{result["queries"]:>3} queries  {result["bytes"]:>9} bytes'
+                    )
+                    if result['status'] != scenario.status:
+                        self.stdout.write(self.style.ERROR(f'  expected status {scenario.status}'))
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved {options["save"]}'))
+
+        if baseline is not None:
+            found = regressions(baseline, report, options['threshold'], options['min_ms'])
+            for size, name, what in found:
+                self.stdout.write(self.style.ERROR(f'{size:>7} articles  {name:<28} {what}'))
+            if found:
+                raise CommandError(f'{len(found)} regressions over {options["threshold"]:g}%')
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def context(self):
+        """
+        The ids and users the scenarios request, from the generated data.
+        """
+        admin = User.objects.create_superuser(username='bench_admin', password=PASSWORD)
+        UserProfile.objects.create(user=admin)
+        admin.groups.add(Group.objects.get_or_create(name='Admin')[0])
+        own = Article.published.filter(author__user__groups__name='Editors').select_related('author__user') \
+            .order_by('id').first()
+        reader = User.objects.filter(username__startswith='load_user_').exclude(groups__name='Editors') \
+            .select_related('userprofile').order_by('id').first()
+        hot = Article.published.annotate(comment_count=Count('comment')).order_by('-comment_count', 'id').first()
+        users = {'admin': admin, 'editor': own.author.user, 'reader': reader}
+        tokens = {role: get_token_for_user(user) for role, user in users.items()}
+
+        context = {
+            'unique': itertools.count().__next__,
+            'tokens': {role: token['access'] for role, token in tokens.items()},
+            'refresh': tokens['reader']['refresh'],
+            'editor_profile': own.author_id,
+            'reader': reader.id,
+            'reader_name': reader.username,
+            'reader_profile': reader.userprofile.id,
+            'own': own.id,
+            'hot': hot.id,
+            'comment': Comment.objects.filter(article=hot).order_by('id').values_list('id', flat=True).first(),
+            'tag': Tag.objects.order_by('id').values_list('id', flat=True).first(),
+            # the two most used tags
+            'tag_names': list(Tag.objects.order_by('-article_count', 'name').values_list('name', flat=True)[:2]),
+            'like': ArticleUserLikes.objects.order_by('id').values_list('id', flat=True).first(),
+            'unliked': list(Article.published.exclude(articleuserlikes__user=reader.userprofile)
+                            .order_by('id').values_list('id', flat=True)[:20]),
+        }
+        next_page = Client().get('/api/articles/').json()['next']
+        context['next_page'] = urlsplit(next_page)._replace(scheme='', netloc='').geturl()
+        return context
+
+    @staticmethod
+    def run(scenario, context, repeat):
+        # errors are results too (a 500 status)
+        client = Client(raise_request_exception=False)
+        headers = {}
+        if scenario.user:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {context["tokens"][scenario.user]}'
+        setup = scenario.setup and (lambda: scenario.setup(context))
+        response = None
+
+        def request():
+            nonlocal response
+            kwargs = dict(headers)
+            if scenario.data is not None:
+                kwargs.update(data=json.dumps(scenario.data(context)), content_type='application/json')
+            response = getattr(client, scenario.method)(scenario.path.format(**context), **kwargs)
+            # a streamed body is part of the time
+            response.body = b''.join(response.streaming_content) if response.streaming else response.content
+
+        # a failing request would log its traceback every time
+        with quiet_requests():
+            # one request untimed, for the queries and the size
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            # (the log starts over with the next request)
+            query_count = len(queries)
+            samples = measure(request, min(repeat, scenario.repeat or repeat), setup)
+
+        return {**summarize(samples), 'queries': query_count, 'bytes': len(response.body),
+                'status': response.status_code}
@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+
+from api.bench import summarize, throwaway_database
+from api.models import Article
+from api.synthetic import generate
+from core.auth import get_token_for_user
+
+from .bench_api import quiet_requests
+
+# the async read routes, as a reader and anonymously (the response cache)
+REQUESTS = [
+    ('articles.list', '/api/articles/', True),
+    ('articles.list.anonymous', '/api/articles/', False),
+    ('articles.retrieve', '/api/articles/{hot}/', True),
+    ('articles.comments', '/api/articles/{hot}/comments/', True),
+    ('auth.check', '/api/auth/auth/', True),
+]
+
+# (name, handler, API_ASYNC_VIEWS)
+DEPLOYMENTS = [
+    ('wsgi', WSGIHandler, False),
+    ('asgi', ASGIHandler, True),
+    # the regular views under ASGI, each in a thread
+    ('asgi-sync', ASGIHandler, False),
+]
+
+
+def wsgi_request(handler, path, headers, method='GET', data=''):
+    environ = RequestFactory().generic(method, path, data, 'application/json', headers=headers).environ
+    response = handler(environ, lambda status, response_headers: None)
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return response.status_code
+
+
+async def asgi_request(handler, path, headers):
+    """
+    One request through `handler` the way an ASGI server sends it.
+    """
+    url = urlsplit(path)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(), 'root_path': '',
+        'query_string': url.query.encode(), 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        'headers': [(b'host', b'testserver'),
+                    *((name.lower().encode(), value.encode()) for name, value in headers.items())],
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    done = asyncio.Event()
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # no disconnect before the response is sent
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif not message.get('more_body'):
+            done.set()
+
+    await handler(scope, receive, send)
+    return status
+
+
+@contextmanager
+def db_latency(seconds):
+    """
+    Add `seconds` to every query, on every connection (a database over the
+    network). time.sleep() holds the thread like a blocking driver does.
+    """
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def add(connection, **kwargs):
+        connection.execute_wrappers.append(wrapper)
+
+    if not seconds:
+        yield
+        return
+    for existing in connections.all():
+        add(existing)
+    connection_created.connect(add)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(add)
+        for existing in connections.all():
+            if wrapper in existing.execute_wrappers:
+                existing.execute_wrappers.remove(wrapper)
+
+
+class Command(BaseCommand):
+    help = ('Load test the async read views: concurrent requests through the WSGI handler (a thread per '
+            'connection) and the ASGI handler (async views, and the regular views), in-process')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=10_000)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 50],
+                            help='Connections sending requests at the same time')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per deployment and concurrency')
+        parser.add_argument('--db-latency', type=float, default=0, help='Milliseconds added to every query')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--only', nargs='+', choices=[name for name, _, _ in DEPLOYMENTS])
+        parser.add_argument('--save', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+        deployments = [deployment for deployment in DEPLOYMENTS
+                       if not options['only'] or deployment[0] in options['only']]
+
+        report = {'meta': {key: options[key] for key in ('articles', 'requests', 'db_latency', 'seed')},
+                  'results': {}}
+        with throwaway_database(), quiet_requests():
+            cache.clear()
+            generate(users=max(20, options['articles'] // 10), articles=options['articles'], seed=options['seed'])
+            plan = self.plan(options['requests'])
+            with db_latency(options['db_latency'] / 1000):
+                for name, handler_class, async_views in deployments:
+                    with override_settings(API_ASYNC_VIEWS=async_views):
+                        handler = handler_class()
+                    results = report['results'][name] = {}
+                    for concurrency in options['concurrency']:
+                        results[concurrency] = result = self.run(handler, plan, concurrency)
+                        self.stdout.write(
+                            f'{name:<10} {concurrency:>4} connections  {result["throughput"]:>8.1f} req/s  '
+                            f'p50 {result["p50"]:>8.2f} ms  p95 {result["p95"]:>8.2f} ms  '
+                            f'{result["errors"]} errors'
+                        )
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved {options["save"]}'))
+
+    def plan(self, count):
+        """
+        `count` (path, headers) requests, the routes of REQUESTS in turn.
+        """
+        reader = User.objects.filter(username__startswith='load_user_').exclude(groups__name='Editors') \
+            .order_by('id').first()
+        authorization = {'Authorization': f'Bearer {get_token_for_user(reader)["access"]}'}
+        hot = Article.published.annotate(comment_count=Count('comment')).order_by('-comment_count', 'id').first()
+        requests = itertools.cycle([(path.format(hot=hot.id), authorization if authenticated else {})
+                                    for _, path, authenticated in REQUESTS])
+        return list(itertools.islice(requests, count))
+
+    @staticmethod
+    def run(handler, plan, concurrency):
+        samples, statuses = [], []
+
+        start = time.perf_counter()
+        if isinstance(handler, ASGIHandler):
+            async def client(requests):
+                for path, headers in requests:
+                    started = time.perf_counter()
+                    status = await asgi_request(handler, path, headers)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    statuses.append(status)
+
+            async def load():
+                await asyncio.gather(*(client(plan[offset::concurrency]) for offset in range(concurrency)))
+
+            asyncio.run(load())
+        else:
+            def client(requests):
+                for path, headers in requests:
+                    started = time.perf_counter()
+                    status = wsgi_request(handler, path, headers)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    statuses.append(status)
+
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(client, [plan[offset::concurrency] for offset in range(concurrency)]))
+        elapsed = time.perf_counter() - start
+
+        return {**summarize(samples), 'throughput': round(len(samples) / elapsed, 1),
+                'errors': sum(status != 200 for status in statuses)}
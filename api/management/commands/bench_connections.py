@@ -0,0 +1,158 @@
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+
+from api.bench import summarize, throwaway_database
+from api.models import Article
+from api.synthetic import generate
+from core.auth import get_token_for_user
+
+from .bench_api import quiet_requests
+from .bench_asgi import wsgi_request
+
+# SQLite's own defaults, for the modes without the pragmas of settings.SQLITE_PRAGMAS
+PLAIN_SQLITE = 'PRAGMA journal_mode=DELETE;PRAGMA synchronous=FULL'
+
+# (name, overrides of the database settings)
+MODES = [
+    # a new connection for every request
+    ('per-request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'init_command': PLAIN_SQLITE, 'pool': False}),
+    # one connection per thread, checked before it is reused
+    ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'init_command': PLAIN_SQLITE, 'pool': False}),
+    # DATABASES as configured (DATABASE_URL, DB_*): the pragmas, or the pool
+    ('configured', {}),
+]
+
+
+@contextmanager
+def database_settings(alias=DEFAULT_DB_ALIAS, **overrides):
+    """
+    Change the settings of the `alias` connections opened in the block.
+    'init_command' and 'pool' are OPTIONS, False removes them.
+    """
+    settings_dict = connections.settings[alias]
+    saved = {**settings_dict, 'OPTIONS': dict(settings_dict['OPTIONS'])}
+    for key, value in overrides.items():
+        if key not in ('init_command', 'pool'):
+            settings_dict[key] = value
+        elif value is False:
+            settings_dict['OPTIONS'].pop(key, None)
+        elif key != 'init_command' or connections[alias].vendor == 'sqlite':
+            settings_dict['OPTIONS'][key] = value
+    try:
+        yield
+    finally:
+        settings_dict.clear()
+        settings_dict.update(saved)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the connection handling under concurrent load: a connection per request, persistent '
+            'connections, and the configured DATABASES (SQLite pragmas or a Postgres pool), through the '
+            'WSGI handler with a thread per client')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=2_000)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 16],
+                            help='Clients sending requests at the same time')
+        parser.add_argument('--requests', type=int, default=1_000, help='Requests per mode and concurrency')
+        parser.add_argument('--write-share', type=float, default=0.1,
+                            help='Share of the requests that post a comment')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--save', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+        if not 0 <= options['write_share'] <= 1:
+            raise CommandError('--write-share must be between 0 and 1')
+
+        report = {'meta': {key: options[key] for key in ('articles', 'requests', 'write_share', 'seed')},
+                  'results': {}}
+        # an in-memory SQLite database never really closes its connections
+        with throwaway_database(on_disk=True), quiet_requests():
+            report['meta']['database'] = connections[DEFAULT_DB_ALIAS].vendor
+            cache.clear()
+            generate(users=max(20, options['articles'] // 10), articles=options['articles'], seed=options['seed'])
+            plan = self.plan(options['requests'], options['write_share'], options['seed'])
+            connections.close_all()
+            handler = WSGIHandler()
+            for name, overrides in MODES:
+                results = report['results'][name] = {}
+                with database_settings(**overrides):
+                    for concurrency in options['concurrency']:
+                        results[concurrency] = result = self.run(handler, plan, concurrency)
+                        self.stdout.write(
+                            f'{name:<12} {concurrency:>4} clients  {result["throughput"]:>8.1f} req/s  '
+                            f'p50 {result["p50"]:>8.2f} ms  p95 {result["p95"]:>8.2f} ms  '
+                            f'{result["connections"]:>5} connections  {result["errors"]} errors'
+                        )
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved {options["save"]}'))
+
+    def plan(self, count, write_share, seed):
+        """
+        `count` (method, path, headers, body) requests of a reader: the
+        article list, an article and its comments, and comments posted.
+        """
+        reader = User.objects.filter(username__startswith='load_user_').exclude(groups__name='Editors') \
+            .order_by('id').first()
+        headers = {'Authorization': f'Bearer {get_token_for_user(reader)["access"]}'}
+        hot = list(Article.published.annotate(comment_count=Count('comment')).order_by('-comment_count', 'id')
+                   .values_list('id', flat=True)[:20])
+        reads = itertools.cycle(
+            [('GET', '/api/articles/', headers, '')]
+            + [('GET', path.format(article_id), headers, '')
+               for article_id in hot for path in ('/api/articles/{}/', '/api/articles/{}/comments/')]
+        )
+        comment = json.dumps({'text': 'A benchmark comment'})
+        rng = random.Random(seed)
+        return [('POST', f'/api/articles/{rng.choice(hot)}/comments/', headers, comment)
+                if rng.random() < write_share else next(reads) for _ in range(count)]
+
+    @staticmethod
+    def run(handler, plan, concurrency):
+        samples, statuses = [], []
+        opened = itertools.count()
+        lock = threading.Lock()
+
+        def count(**kwargs):
+            with lock:
+                next(opened)
+
+        def client(requests):
+            try:
+                for method, path, headers, data in requests:
+                    started = time.perf_counter()
+                    status = wsgi_request(handler, path, headers, method, data)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    statuses.append(status)
+            finally:
+                connections.close_all()
+
+        connection_created.connect(count, weak=False)
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(client, [plan[offset::concurrency] for offset in range(concurrency)]))
+            elapsed = time.perf_counter() - start
+        finally:
+            connection_created.disconnect(count)
+
+        return {**summarize(samples), 'throughput': round(len(samples) / elapsed, 1),
+                'connections': next(opened), 'errors': sum(status not in (200, 201) for status in statuses)}
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.bench import measure, summarize, throwaway_database
+from api.models import Article
+from api.renderers import FastJSONRenderer, orjson
+from api.serialiazers import ArticleSerializer
+from api.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib JSON renderer with the orjson one on serialized articles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000])
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed, both renderers are the stdlib one'))
+
+        with throwaway_database():
+            size = max(options['sizes'])
+            generate(users=max(20, size // 10), articles=size, seed=options['seed'])
+
+            for size in sorted(options['sizes']):
+                articles = Article.objects.prefetch_related('tags').order_by('-created_at')[:size]
+                data = {'next': None, 'previous': None, 'results': ArticleSerializer(articles, many=True).data}
+                megabytes = len(JSONRenderer().render(data)) / 1024 / 1024
+
+                for renderer in (JSONRenderer(), FastJSONRenderer()):
+                    stats = summarize(measure(lambda: renderer.render(data), options['repeat']))
+                    self.stdout.write(
+                        f'{size:>7} articles  {type(renderer).__name__:<17} '
+                        f'p50 {stats["p50"]:>9.2f} ms  {megabytes / stats["p50"] * 1000:>8.1f} MB/s'
+                    )
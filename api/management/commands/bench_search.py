@@ -0,0 +1,79 @@
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from api.bench import measure, summarize, throwaway_database
+from api.caching import invalidate, list_namespace
+from api.models import Article, Tag, UserProfile
+from api.search import get_search_backend
+
+WORDS = ('django python rest framework api search index query database cache web server client '
+         'react model view serializer token user group comment article tag performance benchmark '
+         'latency throughput scale replica shard pool connection thread async sync stream').split()
+
+
+def search_samples(client, query, repeat):
+    """
+    Latencies of an anonymous ?search=query. Each one searches: the response
+    cache would answer the repeats, whatever the backend.
+    """
+    url = f'/api/articles/?search={query}'
+    return measure(lambda: client.get(url), repeat, setup=lambda: invalidate(list_namespace()))
+
+
+class Command(BaseCommand):
+    help = 'Compare the LIKE search with the full-text search backend on generated articles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        queries = ['python', 'replica pool', 'serial', 'benchmark latency throughput']
+
+        with throwaway_database():
+            fulltext = get_search_backend()
+            if not fulltext.ranked:
+                self.stdout.write(self.style.WARNING(f'No full-text search on {fulltext.name}'))
+                return
+
+            random.seed(options['seed'])
+            author = UserProfile.objects.create(user=User.objects.create_user(username='bench'))
+            tags = Tag.objects.bulk_create([Tag(name=word) for word in WORDS[:20]])
+            client = Client()
+            created = 0
+
+            for size in sorted(options['sizes']):
+                self.create_articles(author, tags, created, size)
+                created = size
+                fulltext.index()
+
+                for query in queries:
+                    for backend in ('like', fulltext.name):
+                        with override_settings(ARTICLE_SEARCH_BACKEND=backend):
+                            samples = search_samples(client, query, options['repeat'])
+                        stats = summarize(samples)
+                        self.stdout.write(
+                            f'{size:>7} articles  {backend:<10} {query!r:<32} '
+                            f'p50 {stats["p50"]:>9.2f} ms  p95 {stats["p95"]:>9.2f} ms'
+                        )
+
+    def create_articles(self, author, tags, start, stop, batch_size=5000):
+        through = Article.tags.through
+        for offset in range(start, stop, batch_size):
+            articles = Article.objects.bulk_create([
+                Article(
+                    author=author,
+                    title=f'Article {number} {" ".join(random.sample(WORDS, 3))}',
+                    text=' '.join(random.choices(WORDS, k=80)),
+                    status='published',
+                )
+                for number in range(offset, min(offset + batch_size, stop))
+            ])
+            through.objects.bulk_create([
+                through(article_id=article.id, tag_id=tag.id)
+                for article in articles for tag in random.sample(tags, 3)
+            ])
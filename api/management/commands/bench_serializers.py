@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.bench import measure, summarize, throwaway_database
+from api.models import Article
+from api.serialiazers import ArticleSerializer, ArticleValuesSerializer
+from api.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = 'Compare ArticleSerializer with the .values() fast path of the article list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1_000, 10_000])
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            size = max(options['sizes'])
+            generate(users=max(20, size // 10), articles=size, seed=options['seed'])
+            articles = Article.objects.order_by('-created_at', '-id')
+
+            for size in sorted(options['sizes']):
+                paths = {
+                    'ArticleSerializer': lambda: ArticleSerializer(
+                        articles.prefetch_related('tags')[:size], many=True).data,
+                    'values() fast path': lambda: ArticleValuesSerializer(
+                        ArticleValuesSerializer.values(articles)[:size], many=True).data,
+                }
+                for name, serialize in paths.items():
+                    stats = summarize(measure(serialize, options['repeat']))
+                    self.stdout.write(
+                        f'{size:>7} articles  {name:<18} p50 {stats["p50"]:>9.2f} ms  p95 {stats["p95"]:>9.2f} ms'
+                    )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = ('Decay the trending scores of the articles to now and drop the ones that are no longer '
+            'trending; run it from cron, every few minutes to an hour')
+
+    def handle(self, *args, **options):
+        kept, dropped = trending.decay()
+        self.stdout.write(self.style.SUCCESS(f'{kept} trending articles, {dropped} dropped'))
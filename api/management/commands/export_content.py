@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import FORMATS, RESOURCES, export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Stream every article with its comments and like counts as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--resource', choices=RESOURCES, default='articles',
+                            help='What the CSV rows are (NDJSON nests the comments in the articles)')
+        parser.add_argument('--after', type=int, default=0, help='Resume after this article id')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', help='File to write to, default stdout (not with --gzip)')
+
+    def handle(self, *args, **options):
+        if options['gzip'] and not options['output']:
+            raise CommandError('--gzip needs --output')
+        chunks = export_chunks(options['format'], options['resource'], options['after'],
+                               chunk_size=options['chunk_size'], gzip=options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
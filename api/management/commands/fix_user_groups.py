@@ -1,28 +1,81 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from api.permissions import invalidate_roles
+
+# who belongs in each role group; editors are picked by hand, no rule covers them
+RULES = {
+    'Users': Q(),
+    'Admin': Q(is_superuser=True),
+}
+
 
 class Command(BaseCommand):
-    help = 'Fix user groups - add all users to Users group'
+    help = ('Reconcile the role groups with their rules: every user in Users, superusers in Admin '
+            '(by default only Users, as before). Editors are picked by hand and left alone')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', action='append', choices=RULES, dest='groups',
+                            help='Group to reconcile, repeatable (default: Users)')
+        parser.add_argument('--all-groups', action='store_true')
+        parser.add_argument('--remove-extra', action='store_true',
+                            help='Also remove the members the rule does not cover (e.g. admins who are no superusers)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
 
     def handle(self, *args, **options):
-        # Get or create Users group
-        users_group, created = Group.objects.get_or_create(name='Users')
-        
-        if created:
-            self.stdout.write(self.style.SUCCESS('Created Users group'))
+        names = list(RULES) if options['all_groups'] else options['groups'] or ['Users']
+        for name in names:
+            self.reconcile(name, options)
+
+    def reconcile(self, name, options):
+        if options['dry_run']:
+            group = Group.objects.filter(name=name).first()
         else:
-            self.stdout.write(self.style.SUCCESS('Users group already exists'))
-        
-        # Add all users to Users group
-        users = User.objects.all()
-        added_count = 0
-        
-        for user in users:
-            if not user.groups.filter(name='Users').exists():
-                user.groups.add(users_group)
-                added_count += 1
-                self.stdout.write(f'Added user {user.username} to Users group')
-        
+            group, created = Group.objects.get_or_create(name=name)
+            if created:
+                self.stdout.write(self.style.SUCCESS(f'Created {name} group'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name} group already exists'))
+
+        # one anti-join: the users of the rule without a membership, and the other way round
+        through = User.groups.through
+        member = Exists(through.objects.filter(user_id=OuterRef('pk'), group=group))
+        missing = User.objects.filter(RULES[name]).exclude(member)
+        extra = User.objects.filter(member).exclude(RULES[name]) if options['remove_extra'] else User.objects.none()
+
+        if options['dry_run']:
+            for label, users in (('add to', missing), ('remove from', extra)):
+                count = users.count()
+                if count or label == 'add to':
+                    self.stdout.write(self.style.WARNING(f'Would {label} {name}: {count} users'))
+                if options['verbosity'] > 1:
+                    for username in users.values_list('username', flat=True)[:20]:
+                        self.stdout.write(f'  {username}')
+            return
+
+        added = removed = 0
+        # batches by id, the anti-join skips the memberships just inserted
+        while user_ids := list(missing.order_by('id').values_list('id', flat=True)[:options['batch_size']]):
+            with transaction.atomic():
+                through.objects.bulk_create([through(user_id=user_id, group=group) for user_id in user_ids],
+                                            ignore_conflicts=True)
+                # bulk_create sends no m2m_changed, drop the cached roles here
+                invalidate_roles(user_ids)
+            added += len(user_ids)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Added {added} users to {name} group')
+
+        while user_ids := list(extra.order_by('id').values_list('id', flat=True)[:options['batch_size']]):
+            with transaction.atomic():
+                through.objects.filter(group=group, user_id__in=user_ids).delete()
+                invalidate_roles(user_ids)
+            removed += len(user_ids)
+
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully added {added_count} users to Users group')
+            self.style.SUCCESS(f'Successfully added {added} users to {name} group')
         )
+        if options['remove_extra']:
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} users from {name} group'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = ('Generate skewed synthetic users, articles, tags, comments (with reply chains) and likes '
+            'for load tests; the same seed gives the same data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--articles', type=int, default=10_000)
+        parser.add_argument('--comments-per-article', type=float, default=5,
+                            help='Mean; the popular articles get most of them')
+        parser.add_argument('--likes-density', type=float, default=0.01,
+                            help='Share of the (user, article) pairs with a like or dislike')
+        parser.add_argument('--tags', type=int, default=100)
+        parser.add_argument('--days', type=int, default=365, help='The articles are spread over this many days')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['articles'] < 1 or options['tags'] < 1:
+            raise CommandError('--users, --articles and --tags must be at least 1')
+        if not 0 <= options['likes_density'] <= 1:
+            raise CommandError('--likes-density is a share, between 0 and 1')
+
+        start = time.perf_counter()
+        counts = generate(
+            users=options['users'],
+            articles=options['articles'],
+            comments_per_article=options['comments_per_article'],
+            likes_density=options['likes_density'],
+            tags=options['tags'],
+            seed=options['seed'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {counts["users"]} users, {counts["tags"]} tags, {counts["articles"]} articles, '
+            f'{counts["comments"]} comments and {counts["likes"]} likes in {time.perf_counter() - start:.1f}s'
+        ))
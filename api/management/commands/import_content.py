@@ -0,0 +1,322 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import TextField
+from django.utils.dateparse import parse_datetime
+
+from api.caching import comments_namespace, invalidate, invalidate_articles
+from api.export import RESOURCES
+from api.models import Article, Comment, Tag, UserProfile
+from api import trending
+from api.search import get_search_backend
+from api.signals import recount_tags
+
+
+class Command(BaseCommand):
+    help = 'Load articles (with their tags and comments) or comments from NDJSON or CSV, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON or CSV file, optionally gzipped (.gz); - reads stdin')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='Default: from the file name')
+        parser.add_argument('--resource', choices=RESOURCES, default='articles',
+                            help='What the CSV rows are (NDJSON articles nest their comments)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--default-author', help='Username of the author of records with an unknown author')
+        parser.add_argument('--progress-every', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        # the lookup maps, so that no record needs a query of its own
+        self.authors = dict(UserProfile.objects.values_list('user__username', 'id'))
+        self.author_ids = set(self.authors.values())
+        self.tags = dict(Tag.objects.values_list('name', 'id'))
+        self.tag_ids = set(self.tags.values())
+        # comment ids of the input -> the new ones, for the replies
+        self.comment_ids = {}
+        self.default_author = None
+        if options['default_author']:
+            self.default_author = self.authors.get(options['default_author'])
+            if self.default_author is None:
+                raise CommandError(f'No user profile for {options["default_author"]}')
+
+        self.verbosity = options['verbosity']
+        self.imported = {'articles': 0, 'comments': 0, 'skipped': 0}
+        search = get_search_backend()
+        start = time.perf_counter()
+        reported = 0
+
+        with self.open(options['path']) as stream:
+            records = self.read(stream, options['format'] or self.guess_format(options['path']))
+            while batch := list(itertools.islice(records, options['batch_size'])):
+                with transaction.atomic():
+                    if options['resource'] == 'articles':
+                        article_ids = self.import_articles(batch)
+                        search.index(article_ids)
+                        # their comments
+                        trending.rebuild(article_ids)
+                    else:
+                        article_ids = self.import_comments(batch)
+                        invalidate(*(comments_namespace(article_id) for article_id in article_ids))
+                        trending.rebuild(article_ids)
+
+                done = self.imported[options['resource']]
+                if options['progress_every'] and done - reported >= options['progress_every']:
+                    reported = done
+                    self.stdout.write(f'{done} {options["resource"]} ({done / (time.perf_counter() - start):.0f}/s)')
+
+        if options['resource'] == 'articles':
+            recount_tags()
+        invalidate_articles()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported["articles"]} articles and {self.imported["comments"]} comments, '
+            f'skipped {self.imported["skipped"]} records in {elapsed:.1f}s'
+        ))
+
+    # reading
+
+    @staticmethod
+    def guess_format(path):
+        name = path.removesuffix('.gz')
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.ndjson', '.jsonl')) or path == '-':
+            return 'ndjson'
+        raise CommandError(f'Cannot tell the format of {path}, use --format')
+
+    @staticmethod
+    def open(path):
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return open(path, encoding='utf-8', newline='')
+
+    def read(self, stream, format):
+        if format == 'csv':
+            for row in csv.DictReader(stream):
+                # the export's space separated tag ids (or names)
+                if 'tags' in row:
+                    row['tags'] = [int(tag) if tag.isdigit() else tag for tag in row['tags'].split()]
+                yield {key: value for key, value in row.items() if value != ''}
+        else:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self.skip(line.strip(), 'not JSON')
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    self.skip(record, 'not an object')
+
+    # resolving
+
+    def author_of(self, record):
+        """
+        The profile id of `author` (a username) or `author_id`.
+        """
+        if 'author' in record:
+            return self.authors.get(record['author'], self.default_author)
+        author_id = int(record.get('author_id', 0))
+        return author_id if author_id in self.author_ids else self.default_author
+
+    def tag_ids_of(self, batch):
+        """
+        Tag ids of every record; tags are given by id or name, unknown
+        names are created.
+        """
+        names = {tag for record in batch for tag in record.get('tags', ()) if isinstance(tag, str)}
+        missing = names - self.tags.keys()
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            self.tags.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+            self.tag_ids.update(self.tags[name] for name in missing)
+        return [
+            {self.tags[tag] if isinstance(tag, str) else tag for tag in record.get('tags', ())} & self.tag_ids
+            for record in batch
+        ]
+
+    @staticmethod
+    def optional_int(record, name):
+        return None if record.get(name) is None else int(record[name])
+
+    @staticmethod
+    def check_lists(record):
+        """The nested tags and comments of an article record, of the right types"""
+        tags, comments = record.get('tags', []), record.get('comments', [])
+        if not isinstance(tags, list) or not all(isinstance(tag, (str, int)) for tag in tags):
+            raise TypeError('tags must be a list of names or ids')
+        if not isinstance(comments, list) or not all(isinstance(comment, dict) for comment in comments):
+            raise TypeError('comments must be a list of objects')
+
+    def skip(self, record, reason):
+        self.imported['skipped'] += 1
+        if self.verbosity > 1:
+            self.stderr.write(f'Skipped {str(record)[:80]}: {reason}')
+
+    @staticmethod
+    def check_fields(instance, related):
+        """
+        The model's own field validation (lengths, title pattern, status),
+        as the API does it; the related rows are resolved by the import.
+        """
+        instance.full_clean(exclude=related, validate_unique=False, validate_constraints=False)
+        # the max_length of a TextField is left to the forms (and serializers)
+        too_long = {field.name: [f'Ensure this field has no more than {field.max_length} characters.']
+                    for field in instance._meta.concrete_fields
+                    if isinstance(field, TextField) and field.max_length
+                    and len(getattr(instance, field.attname)) > field.max_length}
+        if too_long:
+            raise ValidationError(too_long)
+
+    @staticmethod
+    def dates(record):
+        return [parse_datetime(record[name]) if record.get(name) else None for name in ('created_at', 'updated_at')]
+
+    # writing
+
+    def import_articles(self, batch):
+        """
+        Insert the new articles of the batch (titles already taken are
+        skipped), their tags and comments. Returns the new ids.
+
+        A title taken by a concurrent insert fails the batch: the tags and
+        comments must not go to an article this import did not write.
+        """
+        titles = {
+            title for (title,) in Article.objects.filter(
+                title__in=[record.get('title') for record in batch if isinstance(record.get('title'), str)]
+            ).values_list('title')
+        }
+        records, articles = [], []
+        for record in batch:
+            try:
+                author = self.author_of(record)
+                self.dates(record)
+                self.check_lists(record)
+                title, text = record.get('title'), record.get('text')
+                if not all(isinstance(value, str) for value in (title, text)):
+                    self.skip(record, 'no title and text')
+                elif author is None:
+                    self.skip(record, 'unknown author')
+                elif title in titles:
+                    self.skip(record, 'title exists')
+                else:
+                    article = Article(author_id=author, title=title, text=text, status=record.get('status', 'draft'))
+                    self.check_fields(article, ['author'])
+                    titles.add(title)
+                    records.append(record)
+                    articles.append(article)
+            except ValidationError as error:
+                self.skip(record, f'invalid fields: {error.message_dict}')
+            except (ValueError, TypeError) as error:
+                self.skip(record, f'invalid value: {error}')
+
+        Article.objects.bulk_create(articles)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # the ids by title, unique, and every one of them was inserted just now
+            ids = dict(Article.objects.filter(title__in=[article.title for article in articles])
+                       .values_list('title', 'id'))
+            for article in articles:
+                article.id = ids[article.title]
+        self.imported['articles'] += len(articles)
+
+        self.set_dates(Article, articles, records)
+
+        through = Article.tags.through
+        through.objects.bulk_create([
+            through(article_id=article.id, tag_id=tag_id)
+            for article, tag_ids in zip(articles, self.tag_ids_of(records)) for tag_id in tag_ids
+        ], ignore_conflicts=True)
+
+        self.insert_comments([
+            dict(comment, article_id=article.id)
+            for article, record in zip(articles, records) for comment in record.get('comments', ())
+        ])
+        return [article.id for article in articles]
+
+    def import_comments(self, batch):
+        records = []
+        for record in batch:
+            try:
+                records.append((record, int(record.get('article_id') or 0)))
+            except (ValueError, TypeError) as error:
+                self.skip(record, f'invalid value: {error}')
+        article_ids = set(Article.objects.filter(
+            id__in={article_id for _, article_id in records if article_id}
+        ).values_list('id', flat=True))
+        comments = []
+        for record, article_id in records:
+            if article_id not in article_ids:
+                self.skip(record, 'unknown article')
+            else:
+                comments.append(dict(record, article_id=article_id))
+        self.insert_comments(comments)
+        return article_ids
+
+    def insert_comments(self, records):
+        comments, kept = [], []
+        for record in records:
+            try:
+                author = self.author_of(record)
+                self.dates(record)
+                # the ids of the replies, checked before anything is inserted
+                record = dict(record, id=self.optional_int(record, 'id'),
+                              reply_to=self.optional_int(record, 'reply_to'))
+            except (ValueError, TypeError) as error:
+                self.skip(record, f'invalid value: {error}')
+                continue
+            if not isinstance(record.get('text'), str):
+                self.skip(record, 'no text')
+            elif author is None:
+                self.skip(record, 'unknown author')
+            else:
+                comment = Comment(article_id=record['article_id'], author_id=author, text=record['text'])
+                try:
+                    self.check_fields(comment, ['article', 'author', 'reply_to'])
+                except ValidationError as error:
+                    self.skip(record, f'invalid fields: {error.message_dict}')
+                    continue
+                kept.append(record)
+                comments.append(comment)
+        Comment.objects.bulk_create(comments)
+        self.imported['comments'] += len(comments)
+
+        # replies point at the new ids of their comments (comments come
+        # after the ones they reply to); it needs the ids back from the insert
+        if connection.features.can_return_rows_from_bulk_insert:
+            replies = []
+            for comment, record in zip(comments, kept):
+                if record['id'] is not None:
+                    self.comment_ids[record['id']] = comment.id
+                if record['reply_to'] is not None:
+                    comment.reply_to_id = self.comment_ids.get(record['reply_to'])
+                    replies.append(comment)
+            Comment.objects.bulk_update([comment for comment in replies if comment.reply_to_id], ['reply_to'])
+            self.set_dates(Comment, comments, kept)
+
+    @staticmethod
+    def set_dates(model, instances, records):
+        """
+        Keep the dates of the records, which auto_now(_add) overrode on insert.
+        """
+        dated = []
+        for instance, record in zip(instances, records):
+            created_at, updated_at = Command.dates(record)
+            if created_at:
+                instance.created_at = created_at
+                instance.updated_at = updated_at or created_at
+                dated.append(instance)
+        if dated:
+            model.objects.bulk_update(dated, ['created_at', 'updated_at'])
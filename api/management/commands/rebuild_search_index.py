@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.caching import invalidate_articles
+from api.models import Article
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the article full-text search index (after bulk imports or raw SQL changes)'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not backend.ranked:
+            self.stdout.write(self.style.WARNING(f'The {backend.name} search backend has no index'))
+            return
+
+        backend.index()
+        # the search results may have changed
+        invalidate_articles()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {Article.objects.count()} articles ({backend.name})')
+        )
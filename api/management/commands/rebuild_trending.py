@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the trending scores of the articles from their likes and comments '
+            '(after bulk imports, raw SQL changes or a change of the weights)')
+
+    def handle(self, *args, **options):
+        count = trending.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{count} trending articles'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from api.models import Article, ArticleUserLikes
+from api.signals import recount_likes
+
+
+class Command(BaseCommand):
+    help = 'Recount the denormalized like/dislike counters of the articles and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted articles')
+
+    def handle(self, *args, **options):
+        # the real counts, in one grouped query:
+        counts = {
+            row['article']: (row['likes'], row['dislikes'])
+            for row in ArticleUserLikes.objects.values('article').annotate(
+                likes=Count('id', filter=Q(like_type='like')),
+                dislikes=Count('id', filter=Q(like_type='dislike')),
+            )
+        }
+
+        drifted = []
+        articles = Article.objects.only('id', 'like_count', 'dislike_count')
+        for article in articles.iterator(chunk_size=options['batch_size']):
+            likes, dislikes = counts.get(article.id, (0, 0))
+            if (article.like_count, article.dislike_count) != (likes, dislikes):
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'Article {article.id}: {article.like_count}/{article.dislike_count} '
+                        f'-> {likes}/{dislikes}'
+                    )
+                drifted.append(article.id)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} articles have drifted counters'))
+            return
+
+        # recount in the UPDATE itself, likes given meanwhile are not lost
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            for start in range(0, len(drifted), batch_size):
+                recount_likes(drifted[start:start + batch_size])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Repaired the counters of {len(drifted)} articles')
+        )
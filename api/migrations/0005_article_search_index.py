@@ -0,0 +1,86 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import api.models
+
+# The full-text index of the articles (see api.search): an FTS5 virtual
+# table on SQLite, mapped by the unmanaged ArticleSearchIndex model, or a
+# tsvector column with a GIN index on PostgreSQL. Other databases keep the
+# LIKE search.
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE api_article_fts USING fts5(
+        title, text, tags, tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    # bm25 column weights of the rank column: title, text, tags
+    "INSERT INTO api_article_fts(api_article_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')",
+    """
+    INSERT INTO api_article_fts(rowid, title, text, tags)
+    SELECT a.id, a.title, a.text,
+           COALESCE((SELECT group_concat(t.name, ' ')
+                     FROM api_article_tags at JOIN api_tag t ON t.id = at.tag_id
+                     WHERE at.article_id = a.id), '')
+    FROM api_article a
+    """,
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE api_article_search (
+        article_id bigint PRIMARY KEY REFERENCES api_article(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX api_article_search_document ON api_article_search USING GIN (document)",
+    """
+    INSERT INTO api_article_search(article_id, document)
+    SELECT a.id, setweight(to_tsvector('english', a.title), 'A')
+                 || setweight(to_tsvector('english', COALESCE((
+                        SELECT string_agg(t.name, ' ')
+                        FROM api_article_tags at JOIN api_tag t ON t.id = at.tag_id
+                        WHERE at.article_id = a.id), '')), 'B')
+                 || setweight(to_tsvector('english', a.text), 'C')
+    FROM api_article a
+    """,
+]
+
+CREATE = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}
+DROP = {'sqlite': 'DROP TABLE api_article_fts', 'postgresql': 'DROP TABLE api_article_search'}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in DROP:
+        schema_editor.execute(DROP[schema_editor.connection.vendor])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_initial_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.CreateModel(
+            name='ArticleSearchIndex',
+            fields=[
+                ('article', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='api.article')),
+                ('title', models.TextField()),
+                ('text', models.TextField()),
+                ('tags', models.TextField()),
+                ('match', api.models.FullTextField(db_column='api_article_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'api_article_fts',
+                'managed': False,
+            },
+        ),
+    ]
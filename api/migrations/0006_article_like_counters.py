@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    Article = apps.get_model('api', 'Article')
+    ArticleUserLikes = apps.get_model('api', 'ArticleUserLikes')
+
+    def count(like_type):
+        likes = (ArticleUserLikes.objects.filter(article=OuterRef('pk'), like_type=like_type)
+                 .values('article').annotate(count=Count('id')).values('count'))
+        return Coalesce(Subquery(likes), 0)
+
+    Article.objects.update(like_count=count('like'), dislike_count=count('dislike'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
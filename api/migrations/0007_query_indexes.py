@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_article_like_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['created_at', 'id'], name='api_article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='api_article_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articleuserlikes',
+            index=models.Index(fields=['article', 'like_type'], name='api_like_article_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articleuserlikes',
+            index=models.Index(fields=['created_at', 'id'], name='api_like_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', 'created_at', 'id'], name='api_comment_article_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at', 'id'], name='api_comment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:32
+
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def compute_scores(apps, schema_editor):
+    # api.trending.rebuild() as of this migration: likes count 1, comments 2,
+    # half as much every day, none older than ten days
+    ArticleScore = apps.get_model('api', 'ArticleScore')
+    ArticleUserLikes = apps.get_model('api', 'ArticleUserLikes')
+    Comment = apps.get_model('api', 'Comment')
+
+    now = timezone.now()
+    scores = defaultdict(float)
+    for queryset, weight in [(ArticleUserLikes.objects.filter(like_type='like'), 1.0), (Comment.objects.all(), 2.0)]:
+        for article_id, created_at in queryset.filter(created_at__gte=now - timedelta(days=10)) \
+                .values_list('article_id', 'created_at'):
+            scores[article_id] += weight * 0.5 ** ((now - created_at) / timedelta(days=1))
+    ArticleScore.objects.bulk_create([ArticleScore(article_id=article_id, score=score, decayed_at=now)
+                                      for article_id, score in scores.items() if score >= 0.05])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_published_articles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleScore',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='api.article')),
+                ('score', models.FloatField(default=0)),
+                ('decayed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['score', 'article'], name='api_score_idx')],
+            },
+        ),
+        migrations.RunPython(compute_scores, migrations.RunPython.noop),
+    ]
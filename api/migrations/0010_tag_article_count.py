@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_articles(apps, schema_editor):
+    Article = apps.get_model('api', 'Article')
+    Tag = apps.get_model('api', 'Tag')
+    articles = (Article.tags.through.objects.filter(tag=OuterRef('pk'), article__status='published')
+                .values('tag').annotate(count=Count('article')).values('count'))
+    Tag.objects.update(article_count=Coalesce(Subquery(articles), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_article_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='article_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-article_count', 'name'], name='api_tag_count_idx'),
+        ),
+        migrations.RunPython(count_articles, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.core.validators import RegexValidator, MinLengthValidator
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Lookup
 
 
 # from django.core import validators
@@ -8,6 +9,14 @@ from django.db import models
 class Tag(models.Model):
     # props
     name = models.CharField(unique=True, max_length=32)
+    # the published articles with the tag, kept up to date by api.signals
+    article_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # the tag cloud, most used first
+            models.Index(fields=['-article_count', 'name'], name='api_tag_count_idx'),
+        ]
 
     # str representation for the admin panel
     def __str__(self):
@@ -33,6 +42,25 @@ STATUS_CHOICES = [
 ]
 
 
+class ArticleQuerySet(models.QuerySet):
+
+    def published(self):
+        return self.filter(status='published')
+
+    def with_status(self, status):
+        return self.filter(status=status)
+
+
+class PublishedManager(models.Manager.from_queryset(ArticleQuerySet)):
+    """
+    Only the published articles, what readers get to see. Queries ordered
+    by created_at run on the partial api_article_published_idx index.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().published()
+
+
 class Article(models.Model):
     # one to many
     author = models.ForeignKey(
@@ -50,6 +78,25 @@ class Article(models.Model):
 
     status = models.CharField(choices=STATUS_CHOICES, default='draft')
 
+    # denormalized ArticleUserLikes counts, kept up to date by api.signals
+    # (repair with the recount_likes command):
+    like_count = models.PositiveIntegerField(default=0)
+    dislike_count = models.PositiveIntegerField(default=0)
+
+    # every article (the default manager), and the published ones only:
+    objects = models.Manager.from_queryset(ArticleQuerySet)()
+    published = PublishedManager()
+
+    class Meta:
+        indexes = [
+            # the keyset pages of the list, newest first
+            models.Index(fields=['created_at', 'id'], name='api_article_created_idx'),
+            # the pages readers get, only as large as the published articles
+            # (the rarer draft/archived pages of editors use the one above)
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='published'),
+                         name='api_article_published_idx'),
+        ]
+
     def __str__(self):
         return f'{self.title} by {self.author.user.username}'
 
@@ -76,6 +123,14 @@ class Comment(models.Model):
                                  on_delete=models.CASCADE
                                  )
 
+    class Meta:
+        indexes = [
+            # the comments of an article, oldest first
+            models.Index(fields=['article', 'created_at', 'id'], name='api_comment_article_idx'),
+            # the keyset pages of all comments
+            models.Index(fields=['created_at', 'id'], name='api_comment_created_idx'),
+        ]
+
     def __str__(self):
         return f'{self.text} by {self.author.user.username}'
 
@@ -97,6 +152,76 @@ class ArticleUserLikes(models.Model):
 
     class Meta:
         unique_together = ['user', 'article']
+        indexes = [
+            # the likes of an article and the counts per type (recount_likes)
+            models.Index(fields=['article', 'like_type'], name='api_like_article_type_idx'),
+            # the keyset pages of all likes
+            models.Index(fields=['created_at', 'id'], name='api_like_created_idx'),
+        ]
+
+    # remember the loaded values, the like counters need to know what changed:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {'article_id': instance.article_id, 'like_type': instance.like_type}
+        return instance
 
     def __str__(self):
-        return f'{self.user.user.username} {self.like_type}d {self.article.title}'
\ No newline at end of file
+        return f'{self.user.user.username} {self.like_type}d {self.article.title}'
+
+
+class ArticleScore(models.Model):
+    """
+    The trending score of an article: its likes and comments, each worth
+    less the older it gets (see api/trending.py). Only the articles with
+    recent activity have one.
+    """
+    article = models.OneToOneField(Article, primary_key=True, on_delete=models.CASCADE, related_name='trending')
+    score = models.FloatField(default=0)
+    # when the score was last decayed, None for a score new since then
+    decayed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the trending feed, highest first
+            models.Index(fields=['score', 'article'], name='api_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.article_id}: {self.score:.2f}'
+
+
+class FullTextField(models.TextField):
+    """
+    The hidden column of an FTS5 table named after the table itself, only
+    good for `__match` lookups.
+    """
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ArticleSearchIndex(models.Model):
+    """
+    The SQLite FTS5 full-text index of the articles (see api/search.py),
+    created by migration 0005 and keyed by the article id as rowid.
+    """
+    article = models.OneToOneField(Article, primary_key=True, db_column='rowid',
+                                   on_delete=models.DO_NOTHING, related_name='search_index')
+    title = models.TextField()
+    text = models.TextField()
+    tags = models.TextField()
+    match = FullTextField(db_column='api_article_fts')
+    # bm25(), lower is better; column weights are set up in the migration
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'api_article_fts'
@@ -0,0 +1,166 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over (created_at, id), or over
+    (search_rank, id) for ranked search results.
+
+    Every page is fetched with `WHERE (created_at, id) < (cursor)` plus a
+    LIMIT, so a deep page costs the same as the first one - no OFFSET scan
+    and no COUNT(*). The cursor is an opaque base64 token holding the
+    position of the last (or first, when paging backwards) row.
+    """
+    # newest first; prefix-less means oldest first
+    ordering = '-created_at'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        if requested > 0:
+            return min(requested, self.max_page_size)
+        return page_size
+
+    def get_ordering(self, queryset):
+        """
+        Ranked search results (see api.search) page by relevance instead.
+        """
+        if 'search_rank' in queryset.query.annotations:
+            return 'search_rank'
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for the async views (see api.async_views)"""
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """
+        The rows of the page, and one more to tell whether there is a next
+        page.
+        """
+        ordering = self.get_ordering(queryset)
+        self.field = ordering.lstrip('-')
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        # paging backwards walks the index the other way and flips the page
+        self.reverse = bool(self.cursor and self.cursor['reverse'])
+        descending = ordering.startswith('-') != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+
+        if self.cursor:
+            queryset = queryset.filter(self.seek(self.cursor, descending))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def seek(self, cursor, descending):
+        """
+        Rows strictly after the cursor position. Spelled with a redundant
+        range on the leading column so the (field, id) index can seek.
+        """
+        op = 'lt' if descending else 'gt'
+        position = cursor['position']
+        return (Q(**{f'{self.field}__{op}e': position})
+                & (Q(**{f'{self.field}__{op}': position}) | Q(**{f'id__{op}': cursor['id']})))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        # an empty page (rows deleted under the cursor) has nowhere to go
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[0]), reverse=True)
+
+    def position_of(self, instance):
+        if isinstance(instance, dict):
+            return {'position': instance[self.field], 'id': instance['id']}
+        return {'position': getattr(instance, self.field), 'id': instance.id}
+
+    def encode_cursor(self, position, reverse):
+        """
+        Build the url of the page right after (or before) `position`.
+        """
+        value = position['position']
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        token = {'p': value, 'i': position['id'], 'r': int(reverse)}
+        encoded = b64encode(json.dumps(token).encode('ascii'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            token = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+            position = token['p']
+            if self.field.endswith('_at'):
+                position = datetime.fromisoformat(position)
+            elif not isinstance(position, (int, float)):
+                raise ValueError(position)
+            return {'position': position, 'id': int(token['i']), 'reverse': bool(token['r'])}
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class CommentPagination(KeysetPagination):
+    """
+    Comments read as a conversation, oldest first.
+    """
+    ordering = 'created_at'
@@ -1,5 +1,82 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 
+from .log import fields, lazy
+
+logger = logging.getLogger(__name__)
+
+
+# Roles are the names of the user's groups (Users, Editors, Admin). They are
+# resolved once per request and memoized on the user object, backed by the
+# shared cache (invalidated from api.signals when memberships change) or,
+# with settings.JWT_ROLES_CLAIM, read from the `roles` claim of the token.
+
+ROLES_CACHE_KEY = 'api:roles:{}'
+
+
+def get_roles(user, token=None):
+    """
+    The set of group names of `user`, empty for anonymous users.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        roles = claimed_roles(token)
+        if roles is None:
+            roles = cache.get_or_set(
+                ROLES_CACHE_KEY.format(user.pk),
+                lambda: frozenset(user.groups.values_list('name', flat=True)),
+                getattr(settings, 'ROLES_CACHE_TIMEOUT', 300),
+            )
+        user._roles = roles
+    return roles
+
+
+async def aget_roles(user, token=None):
+    """
+    get_roles() for the async views: memoized the same way, so that the
+    permission checks after it (has_role) do not touch the database.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        roles = claimed_roles(token)
+        if roles is None:
+            key = ROLES_CACHE_KEY.format(user.pk)
+            roles = await cache.aget(key)
+            if roles is None:
+                roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+                await cache.aset(key, roles, getattr(settings, 'ROLES_CACHE_TIMEOUT', 300))
+        user._roles = roles
+    return roles
+
+
+def claimed_roles(token):
+    if token is not None and getattr(settings, 'JWT_ROLES_CLAIM', False) and 'roles' in token:
+        return frozenset(token['roles'])
+    return None
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([ROLES_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+def has_role(request, *roles):
+    """
+    Whether the user of the request is a superuser or in one of `roles`.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return False
+    return user.is_superuser or not get_roles(user, getattr(request, 'auth', None)).isdisjoint(roles)
+
 
 class IsAdmin(permissions.BasePermission):
     """
@@ -14,10 +91,7 @@ class IsEditorOrAdmin(permissions.BasePermission):
     Allow editors and admins to access the view.
     """
     def has_permission(self, request, view):
-        if not request.user or not request.user.is_authenticated:
-            return False
-        return (request.user.is_superuser or 
-                request.user.groups.filter(name__in=['Editors', 'Admin']).exists())
+        return has_role(request, 'Editors', 'Admin')
 
 
 class IsUserOrEditorOrAdmin(permissions.BasePermission):
@@ -26,20 +100,14 @@ class IsUserOrEditorOrAdmin(permissions.BasePermission):
     """
     def has_permission(self, request, view):
         if not request.user or not request.user.is_authenticated:
-            print(f"DEBUG: User not authenticated: {request.user}")
+            logger.debug('Not authenticated', extra=fields(view=type(view).__name__))
             return False
-        
-        user_groups = list(request.user.groups.values_list('name', flat=True))
-        print(f"DEBUG: User {request.user.username} groups: {user_groups}")
-        
-        is_superuser = request.user.is_superuser
-        has_group = request.user.groups.filter(name__in=['Users', 'Editors', 'Admin']).exists()
-        
-        print(f"DEBUG: Is superuser: {is_superuser}, Has group: {has_group}")
-        
-        result = is_superuser or has_group
-        print(f"DEBUG: Permission result: {result}")
-        
+
+        result = has_role(request, 'Users', 'Editors', 'Admin')
+        logger.debug('Permission checked', extra=fields(
+            view=type(view).__name__, user=request.user.username, allowed=result,
+            roles=lazy(lambda: sorted(get_roles(request.user, getattr(request, 'auth', None)))),
+        ))
         return result
 
 class CommentOwnerOrReadOnly(permissions.BasePermission):
@@ -0,0 +1,278 @@
+"""
+Opt-in request profiling (settings.API_PROFILING, see ProfilingMiddleware).
+
+Every request gets a RequestProfile: wall time, the time and count of its
+database queries (with the queries run more than once, the mark of an
+N+1), the time spent in serializers and in rendering, and the response
+size. It is sent back in a Server-Timing header and added to per-endpoint
+totals of this process, which /api/_metrics serves in the Prometheus text
+format along with the response cache counters. A share of the requests
+(API_PROFILING_SAMPLE_RATE) also runs under cProfile, dumped to
+API_PROFILING_DIR.
+"""
+import cProfile
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+from .caching import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the request duration histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_current = ContextVar('api_request_profile', default=None)
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall = 0
+        self.db_time = 0
+        self.queries = Counter()
+        self.timers = defaultdict(float)
+        self.running = set()
+        self.render_start = None
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self):
+        """Queries run again with the same SQL (other parameters, usually)"""
+        return sum(count - 1 for count in self.queries.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        # a connection.execute_wrapper(): times every query of the request
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries[sql] += 1
+
+    def server_timing(self):
+        metrics = [
+            f'total;dur={self.wall * 1000:.2f}',
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.query_count} queries ({self.duplicates} duplicates)"',
+        ]
+        metrics += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in sorted(self.timers.items())]
+        return ', '.join(metrics)
+
+
+@contextmanager
+def profiled(name):
+    """
+    Add the time of the block to the `name` timer of the current request
+    (nested blocks of the same timer count once). A no-op when the request
+    is not profiled.
+    """
+    profile = _current.get()
+    if profile is None or name in profile.running:
+        yield
+        return
+    profile.running.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timers[name] += time.perf_counter() - start
+        profile.running.discard(name)
+
+
+def instrument_serializers():
+    """
+    Time BaseSerializer.data, which every DRF serializer (list, model,
+    nested) goes through. Done once, when the middleware is enabled.
+    """
+    data = BaseSerializer.data.fget
+    if getattr(data, 'profiled', False):
+        return
+
+    def timed_data(self):
+        with profiled('serialize'):
+            return data(self)
+
+    timed_data.profiled = True
+    BaseSerializer.data = property(timed_data)
+
+
+class Metrics:
+    """
+    Per-endpoint totals of the profiled requests of this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(Counter)
+        self.statuses = Counter()
+
+    def add(self, endpoint, method, status, profile, size):
+        key = (endpoint, method)
+        with self.lock:
+            totals = self.endpoints[key]
+            totals['count'] += 1
+            totals['wall'] += profile.wall
+            totals['db'] += profile.db_time
+            totals['queries'] += profile.query_count
+            totals['duplicates'] += profile.duplicates
+            totals['serialize'] += profile.timers['serialize']
+            totals['render'] += profile.timers['render']
+            totals['bytes'] += size
+            for bound in BUCKETS:
+                if profile.wall <= bound:
+                    totals[bound] += 1
+            self.statuses[(endpoint, method, status)] += 1
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.statuses.clear()
+
+    def prometheus(self):
+        """
+        The totals, and the response cache counters, in the Prometheus
+        text exposition format.
+        """
+        with self.lock:
+            endpoints = sorted((key, Counter(totals)) for key, totals in self.endpoints.items())
+            statuses = sorted(self.statuses.items())
+
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                text = ','.join(f'{label}="{escape(str(v))}"' for label, v in labels.items())
+                lines.append(f'{name}{suffix}{{{text}}} {value:g}')
+
+        def per_endpoint(key):
+            return [('', {'endpoint': endpoint, 'method': method}, totals[key])
+                    for (endpoint, method), totals in endpoints]
+
+        family('api_requests_total', 'counter', 'Profiled requests.', [
+            ('', {'endpoint': endpoint, 'method': method, 'status': status}, count)
+            for (endpoint, method, status), count in statuses
+        ])
+        histogram = []
+        for (endpoint, method), totals in endpoints:
+            labels = {'endpoint': endpoint, 'method': method}
+            histogram += [('_bucket', {**labels, 'le': f'{bound:g}'}, totals[bound]) for bound in BUCKETS]
+            histogram += [('_bucket', {**labels, 'le': '+Inf'}, totals['count']),
+                          ('_sum', labels, totals['wall']), ('_count', labels, totals['count'])]
+        family('api_request_duration_seconds', 'histogram', 'Wall time of the requests.', histogram)
+        family('api_db_duration_seconds_total', 'counter', 'Time spent in database queries.', per_endpoint('db'))
+        family('api_db_queries_total', 'counter', 'Database queries.', per_endpoint('queries'))
+        family('api_db_duplicate_queries_total', 'counter',
+               'Queries repeating the SQL of an earlier query of the same request (N+1).',
+               per_endpoint('duplicates'))
+        family('api_serializer_duration_seconds_total', 'counter',
+               'Time spent in serializers (with the queries they run).', per_endpoint('serialize'))
+        family('api_render_duration_seconds_total', 'counter', 'Time spent rendering responses.',
+               per_endpoint('render'))
+        family('api_response_bytes_total', 'counter', 'Response bodies (not the streamed ones).',
+               per_endpoint('bytes'))
+        family('api_response_cache_total', 'counter', 'Anonymous article response cache lookups.', [
+            ('', {'kind': key.rsplit('_', 1)[0], 'result': key.rsplit('_', 1)[1]}, count)
+            for key, count in sorted(cache_stats.items())
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+def endpoint_of(request):
+    """
+    `<view>.<action>` of the request (ArticleViewSet.list), or the url name.
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view = getattr(match.func, 'cls', None)
+    actions = getattr(match.func, 'actions', None) or {}
+    if view is None:
+        return match.view_name or 'unnamed'
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view.__name__}.{action}'
+
+
+class ProfilingMiddleware:
+    """
+    Profile every request when settings.API_PROFILING is on (otherwise
+    the middleware removes itself). Requests with more than
+    API_PROFILING_DUPLICATES_WARNING duplicate queries are logged.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_PROFILING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'API_PROFILING_SAMPLE_RATE', 0)
+        self.directory = Path(getattr(settings, 'API_PROFILING_DIR', 'profiles'))
+        self.duplicates_warning = getattr(settings, 'API_PROFILING_DUPLICATES_WARNING', 10)
+        instrument_serializers()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        sampler = cProfile.Profile() if self.sample_rate and random.random() < self.sample_rate else None
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                if sampler is not None:
+                    response = sampler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        now = time.perf_counter()
+        profile.wall = now - profile.start
+        if profile.render_start is not None:
+            profile.timers['render'] += now - profile.render_start
+
+        endpoint = endpoint_of(request)
+        size = 0 if response.streaming else len(response.content)
+        metrics.add(endpoint, request.method, response.status_code, profile, size)
+        response['Server-Timing'] = profile.server_timing()
+
+        if profile.duplicates > self.duplicates_warning:
+            logger.warning('%s %s: %d duplicate queries of %d, the most repeated: %s', request.method,
+                           request.path, profile.duplicates, profile.query_count,
+                           profile.queries.most_common(1)[0][0][:200])
+        if sampler is not None:
+            self.dump(sampler, endpoint)
+        return response
+
+    def process_template_response(self, request, response):
+        # the DRF response is rendered right after this, the render ends
+        # when get_response returns
+        profile = _current.get()
+        if profile is not None:
+            profile.render_start = time.perf_counter()
+        return response
+
+    def dump(self, sampler, endpoint):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{random.randrange(16 ** 6):06x}.prof'
+        sampler.dump_stats(path)
@@ -0,0 +1,56 @@
+"""
+JSON renderer and parser backed by orjson, a drop-in for DRF's JSONRenderer
+and JSONParser (see REST_FRAMEWORK in final/settings.py). Without orjson
+installed they fall back to the stdlib implementation of their parent.
+"""
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib path is DRF's own
+    orjson = None
+
+
+if orjson is not None:
+    # every type orjson does not handle the way DRF does is passed on to
+    # DRF's JSONEncoder: datetimes ('Z' for UTC), dataclasses, Decimals,
+    # lazy strings, querysets...
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+    default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    Same output as JSONRenderer for the compact, unicode JSON this API
+    renders. Indented output (the browsable API, `; indent=`) and an
+    ensure_ascii / non-compact configuration go through the parent.
+    NaN and Infinity render as null instead of raising.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=default, option=OPTIONS)
+        # like the parent, keep the output a strict javascript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8') or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson rejects NaN/Infinity like the strict stdlib path
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
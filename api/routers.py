@@ -0,0 +1,132 @@
+"""
+Read replicas (settings.DATABASE_REPLICAS, from DATABASE_REPLICA_URLS).
+
+ReplicaRoutingMiddleware picks the database the reads of a request go to
+and ReplicaRouter sends them there:
+
+- GET, HEAD and OPTIONS requests read from a replica, one per request;
+- every other request reads and writes the primary (`default`);
+- for API_REPLICA_STICKY_SECONDS after a successful write, the same user
+  reads from the primary too, so that they see what they just wrote
+  (read-your-writes) despite the replication lag;
+- outside of requests (commands, the shell) and while filling the
+  anonymous response cache (see api.caching), reads go to the primary.
+
+The user is the `user_id` claim of the request's access token, read
+without checking the signature: it only decides where the user's own
+reads go, authentication still checks the token.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+# the database the reads of the current request go to, None for the primary
+_read_database = ContextVar('api_read_database', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_KEY = 'api:primary:{}'
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def read_from(alias):
+    """The reads of the block go to `alias` (None: the primary)"""
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def primary():
+    return read_from(None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def token_user_id(request):
+    """The user id of the access token of the request, unverified"""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return jwt.decode(header[1], options={'verify_signature': False}).get(jwt_settings.USER_ID_CLAIM)
+    except jwt.PyJWTError:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of every request: to a replica, or to the primary for
+    writes and for the users who wrote a moment ago.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        replicas = get_replicas()
+        if not replicas:
+            return self.get_response(request)
+
+        user_id = token_user_id(request)
+        sticky = user_id is not None and cache.get(STICKY_KEY.format(user_id))
+        with read_from(self.read_database(request, replicas, sticky)):
+            response = self.get_response(request)
+        if self.wrote(request, response, user_id):
+            cache.set(STICKY_KEY.format(user_id), True, settings.API_REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        replicas = get_replicas()
+        if not replicas:
+            return await self.get_response(request)
+
+        user_id = token_user_id(request)
+        sticky = user_id is not None and await cache.aget(STICKY_KEY.format(user_id))
+        with read_from(self.read_database(request, replicas, sticky)):
+            response = await self.get_response(request)
+        if self.wrote(request, response, user_id):
+            await cache.aset(STICKY_KEY.format(user_id), True, settings.API_REPLICA_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def read_database(request, replicas, sticky):
+        if request.method not in SAFE_METHODS or sticky:
+            return None
+        return random.choice(replicas)
+
+    @staticmethod
+    def wrote(request, response, user_id):
+        return user_id is not None and request.method not in SAFE_METHODS and response.status_code < 400
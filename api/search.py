@@ -0,0 +1,230 @@
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+
+class LikeSearchBackend:
+    """
+    The original search: icontains lookups over the title, the text and the
+    tag names, as DRF's SearchFilter did. No index and no ranking; it stays
+    as the fallback for databases without a full-text engine.
+    """
+    name = 'like'
+    ranked = False
+
+    def search(self, queryset, terms):
+        """
+        The articles with every term in any of the columns.
+        """
+        tagged = queryset.model.tags.through.objects
+        for term in terms:
+            # the tags as a subquery: a join would repeat the articles with several matching tags
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(text__icontains=term)
+                | Q(id__in=tagged.filter(tag__name__icontains=term).values('article_id'))
+            )
+        return queryset
+
+    def normalize(self, terms):
+        """
+        The terms as far as the results go, for the response cache: the
+        same normalized terms, the same articles. LIKE matches the terms
+        as they are, in any order.
+        """
+        return sorted(set(terms))
+
+    def highlight(self, articles, terms):
+        """
+        Add the `search_snippet` of the match to the given article rows
+        (dicts, see ArticleValuesSerializer).
+        """
+
+    def index(self, article_ids=None):
+        pass
+
+    def remove(self, article_ids):
+        pass
+
+
+class FullTextSearchBackend(LikeSearchBackend):
+    """
+    Base for the full-text backends. The index lives in a side table keyed
+    by article id (see migration 0005) that holds the title, text and tag
+    names of every article; `index()`/`remove()` keep it in sync and are
+    called from api.signals.
+
+    `search()` annotates the queryset with `search_rank`, lower is better,
+    which KeysetPagination then pages over.
+    """
+    ranked = True
+
+    # the match delimiters the database puts in the snippets, made <mark>
+    # once the article text around them is escaped (see marked())
+    START, STOP = '\x02', '\x03'
+
+    # the document of every article, `{where}` narrows it down
+    documents_sql = """
+        SELECT a.id AS id, a.title AS title, a.text AS text,
+               COALESCE((SELECT {concat}
+                         FROM api_article_tags at JOIN api_tag t ON t.id = at.tag_id
+                         WHERE at.article_id = a.id), '') AS tags
+        FROM api_article a {where}
+    """
+
+    def index(self, article_ids=None):
+        """
+        (Re)index the given articles, or all of them.
+        """
+        where, params = '', []
+        if article_ids is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table}')
+        else:
+            article_ids = list(article_ids)
+            if not article_ids:
+                return
+            self.remove(article_ids)
+            where = f"WHERE a.id IN ({', '.join(['%s'] * len(article_ids))})"
+            params = article_ids
+
+        documents = self.documents_sql.format(concat=self.concat, where=where)
+        with connection.cursor() as cursor:
+            cursor.execute(self.insert_sql.format(documents=documents), params)
+
+    def remove(self, article_ids):
+        article_ids = list(article_ids)
+        if not article_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE {self.key} IN ({', '.join(['%s'] * len(article_ids))})",
+                article_ids,
+            )
+
+    @staticmethod
+    def words(terms):
+        """
+        Split the search terms into plain words, the full-text query syntax
+        itself is never exposed to the client.
+        """
+        return [word for term in terms for word in re.findall(r'\w+', term)]
+
+    @classmethod
+    def marked(cls, snippet):
+        """
+        The snippet as HTML: the article text escaped, the matches in <mark>.
+        """
+        return html.escape(snippet).replace(cls.START, '<mark>').replace(cls.STOP, '</mark>')
+
+    def normalize(self, terms):
+        # the words of the query, which the index matches whatever the case
+        return sorted({word.lower() for word in self.words(terms)})
+
+
+class SQLiteSearchBackend(FullTextSearchBackend):
+    """
+    FTS5 virtual table `api_article_fts(title, text, tags)` with the
+    article id as rowid (the ArticleSearchIndex model), ranked with bm25().
+    """
+    name = 'sqlite'
+    table = 'api_article_fts'
+    key = 'rowid'
+    concat = "group_concat(t.name, ' ')"
+    insert_sql = """
+        INSERT INTO api_article_fts(rowid, title, text, tags)
+        SELECT id, title, text, tags FROM ({documents}) AS documents
+    """
+
+    def match(self, terms):
+        # every word has to appear, as a prefix, in any of the columns
+        return ' '.join('"%s"*' % word for word in self.words(terms))
+
+    def search(self, queryset, terms):
+        query = self.match(terms)
+        if not query:
+            return queryset.none()
+        # a join on the index, FTS5 computes the rank of every match once
+        return queryset.filter(search_index__match=query).annotate(search_rank=F('search_index__rank'))
+
+    def highlight(self, articles, terms):
+        query = self.match(terms)
+        if not articles or not query:
+            return
+        by_id = {article['id']: article for article in articles}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid, snippet(api_article_fts, -1, %s, %s, '...', 16) "
+                "FROM api_article_fts WHERE api_article_fts MATCH %s "
+                f"AND rowid IN ({', '.join(['%s'] * len(by_id))})",
+                [self.START, self.STOP, query, *by_id],
+            )
+            for article_id, snippet in cursor.fetchall():
+                by_id[article_id]['search_snippet'] = self.marked(snippet)
+
+
+class PostgresSearchBackend(FullTextSearchBackend):
+    """
+    `api_article_search(article_id, document tsvector)` with a GIN index,
+    ranked with ts_rank() - negated, so that lower is better here too.
+    """
+    name = 'postgresql'
+    table = 'api_article_search'
+    key = 'article_id'
+    concat = "string_agg(t.name, ' ')"
+    insert_sql = """
+        INSERT INTO api_article_search(article_id, document)
+        SELECT id, setweight(to_tsvector('english', title), 'A')
+                   || setweight(to_tsvector('english', tags), 'B')
+                   || setweight(to_tsvector('english', text), 'C')
+        FROM ({documents}) AS documents
+    """
+
+    def match(self, terms):
+        return ' & '.join('%s:*' % word for word in self.words(terms))
+
+    def search(self, queryset, terms):
+        query = self.match(terms)
+        if not query:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            "SELECT article_id FROM api_article_search WHERE document @@ to_tsquery('english', %s)", [query]
+        )).annotate(search_rank=RawSQL(
+            "SELECT -ts_rank(document, to_tsquery('english', %s)) FROM api_article_search "
+            "WHERE article_id = api_article.id",
+            [query], output_field=FloatField(),
+        ))
+
+    def highlight(self, articles, terms):
+        query = self.match(terms)
+        if not articles or not query:
+            return
+        by_id = {article['id']: article for article in articles}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, ts_headline('english', text, to_tsquery('english', %s), %s) "
+                f"FROM api_article WHERE id IN ({', '.join(['%s'] * len(by_id))})",
+                [query, f'StartSel="{self.START}", StopSel="{self.STOP}", MaxWords=16, MinWords=8', *by_id],
+            )
+            for article_id, snippet in cursor.fetchall():
+                by_id[article_id]['search_snippet'] = self.marked(snippet)
+
+
+BACKENDS = {
+    backend.name: backend for backend in (LikeSearchBackend, SQLiteSearchBackend, PostgresSearchBackend)
+}
+
+
+def get_search_backend(name=None):
+    """
+    The backend named by settings.ARTICLE_SEARCH_BACKEND. 'auto' picks the
+    full-text backend of the database in use, or the like backend when
+    the database has none.
+    """
+    name = name or getattr(settings, 'ARTICLE_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = connection.vendor if connection.vendor in BACKENDS else 'like'
+    return BACKENDS[name]()
@@ -8,8 +8,12 @@ from rest_framework import serializers
 from django.core.validators import RegexValidator
 
 from rest_framework.fields import HiddenField, SerializerMethodField
+from django.db.models import Aggregate, CharField, OuterRef, Subquery
 from core.auth import CurrentProfileDefault ,CurrentUserDefault
 
+from .profiling import profiled
+from .threads import in_thread_of
+
 
 class UserSerializer(ModelSerializer):
     password = serializers.CharField(
@@ -54,11 +58,23 @@ class CommentSerializer(ModelSerializer):
     author_id = SerializerMethodField('get_author_id')
     class Meta:
         model = Comment
-        fields = ['id', 'text', 'author', 'article', 'created_at', 'updated_at', 'author_id']
+        fields = ['id', 'text', 'author', 'article', 'reply_to', 'created_at', 'updated_at', 'author_id']
     
     # a helper method that returns the id of the author:
     def get_author_id(self, obj):
-        return obj.author.id
+        return obj.author_id
+
+    # replies stay in the thread of their article, and out of their own replies:
+    def validate(self, attrs):
+        reply_to = attrs.get('reply_to')
+        if reply_to is None:
+            return attrs
+        article = self.instance.article if self.instance else self.context.get('article')
+        if article is not None and reply_to.article_id != article.id:
+            raise serializers.ValidationError({'reply_to': ['The comment replied to belongs to another article.']})
+        if self.instance is not None and in_thread_of(self.instance, reply_to):
+            raise serializers.ValidationError({'reply_to': ['A comment cannot reply to itself or to its replies.']})
+        return attrs
 
 
 class UserProfileSerializer(ModelSerializer):
@@ -67,7 +83,7 @@ class UserProfileSerializer(ModelSerializer):
     # a helper method that returns the id of the user:
 
     def get_user_id(self, obj):
-        return obj.user.id
+        return obj.user_id
 
     class Meta:
         model = UserProfile
@@ -79,17 +95,26 @@ class ArticleSerializer(ModelSerializer):
     author_id = SerializerMethodField('get_author_id')
     # a helper method that returns the id of the author:
     def get_author_id(self, obj):
-        return obj.author.id
+        return obj.author_id
+
+    # search results carry a highlighted snippet of the match:
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'search_snippet'):
+            data['search_snippet'] = instance.search_snippet
+        return data
     
     class Meta:
         model = Article
         fields = "__all__"
+        read_only_fields = ['like_count', 'dislike_count']
 
 
 class TagSerializer(ModelSerializer):
     class Meta:
         model = Tag
         fields = "__all__"
+        read_only_fields = ['article_count']
 
 
 class ArticleUserLikesSerializer(ModelSerializer):
@@ -98,8 +123,83 @@ class ArticleUserLikesSerializer(ModelSerializer):
     # a helper method that returns the id of the user:
 
     def get_user_id(self, obj):
-        return obj.user.id
+        return obj.user_id
 
     class Meta:
         model = ArticleUserLikes
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+
+# Read-only fast path of the GET lists (see ValuesListMixin in api/views.py):
+# the rows come from .values() and are rendered straight into the JSON of the
+# serializers above, without a serializer and its fields per row.
+
+class GroupConcat(Aggregate):
+    """
+    The values of a group as one comma separated string.
+    """
+    function = 'GROUP_CONCAT'
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='STRING_AGG',
+                           template="%(function)s((%(expressions)s)::text, ',')", **extra_context)
+
+
+class ValuesSerializer:
+    # output key -> column of the .values() row, in the output order
+    fields = {}
+    datetime_fields = ('created_at', 'updated_at')
+    # DRF's own formatting: the current time zone, 'Z' for UTC
+    to_datetime = serializers.DateTimeField().to_representation
+
+    def __init__(self, rows, many=True, **kwargs):
+        self.rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.fields.values())
+
+    def to_representation(self, row):
+        data = {key: row[column] for key, column in self.fields.items()}
+        for key in self.datetime_fields:
+            if data[key] is not None:
+                data[key] = self.to_datetime(data[key])
+        return data
+
+    @property
+    def data(self):
+        with profiled('serialize'):
+            return [self.to_representation(row) for row in self.rows]
+
+
+class CommentValuesSerializer(ValuesSerializer):
+    """Same output as CommentSerializer"""
+    fields = {'id': 'id', 'text': 'text', 'reply_to': 'reply_to_id', 'created_at': 'created_at',
+              'updated_at': 'updated_at', 'author_id': 'author_id'}
+
+
+class ArticleValuesSerializer(ValuesSerializer):
+    """Same output as ArticleSerializer, the tag ids are aggregated in SQL"""
+    fields = {'id': 'id', 'author_id': 'author_id', 'title': 'title', 'text': 'text',
+              'created_at': 'created_at', 'updated_at': 'updated_at', 'status': 'status',
+              'like_count': 'like_count', 'dislike_count': 'dislike_count', 'tags': 'tag_ids'}
+
+    @classmethod
+    def values(cls, queryset):
+        through = Article.tags.through
+        tag_ids = Subquery(through.objects.filter(article=OuterRef('pk'))
+                           .values('article').annotate(ids=GroupConcat('tag')).values('ids'))
+        # ranked search results page over their rank, see KeysetPagination
+        ranked = ['search_rank'] if 'search_rank' in queryset.query.annotations else []
+        return queryset.prefetch_related(None).annotate(tag_ids=tag_ids).values(*cls.fields.values(), *ranked)
+
+    def to_representation(self, row):
+        data = super().to_representation(row)
+        # like the prefetched m2m, ordered by tag id
+        data['tags'] = sorted(map(int, data['tags'].split(','))) if data['tags'] else []
+        if 'search_snippet' in row:
+            data['search_snippet'] = row['search_snippet']
+        if 'trending_score' in row:
+            data['trending_score'] = round(row['trending_score'], 3)
+        return data
@@ -0,0 +1,217 @@
+from django.contrib.auth.models import Group, User
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import comments_namespace, invalidate, invalidate_articles
+from .models import Article, ArticleUserLikes, Comment, Tag
+from .permissions import invalidate_roles
+from .search import get_search_backend
+from .trending import WEIGHTS, bump
+
+
+# search index and cached responses
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index([instance.pk])
+        invalidate_article(instance.pk)
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+    invalidate_article(instance.pk)
+
+
+def invalidate_article(article_id):
+    # its comments too: they go (404) with an unpublished or deleted article
+    invalidate_articles([article_id])
+    invalidate(comments_namespace(article_id))
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def index_article_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # tag.article_set.clear(): by post_clear the articles are unknown
+        instance._article_ids = list(instance.article_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            article_ids = [instance.pk]
+        elif action == 'post_clear':
+            article_ids = getattr(instance, '_article_ids', [])
+        else:
+            article_ids = pk_set
+        get_search_backend().index(article_ids)
+        # the tags are part of the articles: their ETags (see api.conditional) change
+        Article.objects.filter(id__in=article_ids).update(updated_at=timezone.now())
+        invalidate_articles(article_ids)
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        article_ids = list(instance.article_set.values_list('id', flat=True))
+        get_search_backend().index(article_ids)
+        invalidate_articles(article_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_articles(sender, instance, **kwargs):
+    instance._article_ids = list(instance.article_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def index_deleted_tag(sender, instance, **kwargs):
+    get_search_backend().index(getattr(instance, '_article_ids', []))
+    invalidate_articles(getattr(instance, '_article_ids', []))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(comments_namespace(instance.article_id))
+
+
+# tag counts
+
+def recount_tags(tag_ids=None):
+    """
+    Count the published articles of the given tags (every tag: None) again,
+    in the UPDATE itself.
+    """
+    articles = (Article.tags.through.objects.filter(tag=OuterRef('pk'), article__status='published')
+                .values('tag').annotate(count=Count('article')).values('count'))
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(id__in=tag_ids)
+    tags.update(article_count=Coalesce(Subquery(articles), 0))
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def count_article_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action == 'pre_clear':
+        # article.tags.clear(): by post_clear the tags are unknown
+        instance._tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            recount_tags([instance.pk])
+        elif action == 'post_clear':
+            recount_tags(getattr(instance, '_tag_ids', []))
+        else:
+            recount_tags(pk_set)
+
+
+@receiver(post_save, sender=Article)
+def count_saved_article(sender, instance, raw=False, **kwargs):
+    # the status may have changed
+    if not raw:
+        recount_tags(Article.tags.through.objects.filter(article=instance).values('tag'))
+
+
+@receiver(pre_delete, sender=Article)
+def remember_article_tags(sender, instance, **kwargs):
+    instance._tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def count_deleted_article(sender, instance, **kwargs):
+    if instance.status == 'published':
+        recount_tags(getattr(instance, '_tag_ids', []))
+
+
+# trending scores (the likes count along with the like counters below)
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(instance.article_id, WEIGHTS['comment'])
+
+
+@receiver(post_delete, sender=Comment)
+def unscore_comment(sender, instance, **kwargs):
+    bump(instance.article_id, -WEIGHTS['comment'])
+
+
+# like counters
+
+COUNTERS = {'like': 'like_count', 'dislike': 'dislike_count'}
+
+
+def count_like(article_id, like_type, delta):
+    counter = COUNTERS[like_type]
+    # update() skips auto_now, the ETags (see api.conditional) need updated_at to move;
+    # never below 0, a counter that drifted low must not fail the unlike
+    Article.objects.filter(pk=article_id).update(**{counter: Greatest(F(counter) + delta, 0)},
+                                                 updated_at=timezone.now())
+    invalidate_articles([article_id])
+    if like_type in WEIGHTS:
+        bump(article_id, delta * WEIGHTS[like_type])
+
+
+def recount_likes(article_ids):
+    """
+    Recount the counters of the given articles from their likes, in the
+    UPDATE itself (after bulk writes, which send no signals, and repairs).
+    """
+    article_ids = list(article_ids)
+
+    def count(like_type):
+        likes = (ArticleUserLikes.objects.filter(article=OuterRef('pk'), like_type=like_type)
+                 .values('article').annotate(count=Count('id')).values('count'))
+        return Coalesce(Subquery(likes), 0)
+
+    Article.objects.filter(id__in=article_ids).update(
+        **{counter: count(like_type) for like_type, counter in COUNTERS.items()}, updated_at=timezone.now()
+    )
+    invalidate_articles(article_ids)
+
+
+@receiver(post_save, sender=ArticleUserLikes)
+def count_saved_like(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded', None)
+    if created:
+        count_like(instance.article_id, instance.like_type, 1)
+    elif loaded and (loaded['article_id'], loaded['like_type']) != (instance.article_id, instance.like_type):
+        # a like flipped to a dislike (or moved to another article)
+        count_like(loaded['article_id'], loaded['like_type'], -1)
+        count_like(instance.article_id, instance.like_type, 1)
+    instance._loaded = {'article_id': instance.article_id, 'like_type': instance.like_type}
+
+
+@receiver(post_delete, sender=ArticleUserLikes)
+def count_deleted_like(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded', None) or {'article_id': instance.article_id,
+                                                    'like_type': instance.like_type}
+    count_like(loaded['article_id'], loaded['like_type'], -1)
+
+
+# cached roles
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_member_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear(): by post_clear the members are unknown
+        instance._member_ids = list(instance.user_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            invalidate_roles([instance.pk])
+        elif action == 'post_clear':
+            invalidate_roles(getattr(instance, '_member_ids', []))
+        else:
+            invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_renamed_group(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_roles(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_deleted_group(sender, instance, **kwargs):
+    invalidate_roles(instance.user_set.values_list('id', flat=True))
@@ -0,0 +1,236 @@
+"""
+Synthetic, skewed content for load tests and benchmarks (the
+generate_load_data command; the bench_* commands can call `generate()`
+inside api.bench.throwaway_database()).
+
+The shape follows real blogs rather than uniform noise: article
+popularity (comments, likes), user activity and tag usage are Zipfian,
+and comments form reply chains. Everything comes from one
+random.Random(seed), so a seed always gives the same data.
+
+Rows get explicit primary keys, numbered after the existing ones, so
+that replies, likes and tags can point at rows of the same batch and
+every table is written with plain bulk inserts. Dates are spread over
+`days`, one UPDATE per day and table, as auto_now(_add) fields cannot be
+set on insert.
+"""
+import bisect
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import trending
+from .caching import invalidate_articles
+from .models import Article, ArticleUserLikes, Comment, Tag, UserProfile
+from .search import get_search_backend
+from .signals import recount_tags
+
+WORDS = ('django python rest framework api search index query database cache web server client '
+         'react model view serializer token user group comment article tag performance benchmark '
+         'latency throughput scale replica shard pool connection thread async sync stream queue '
+         'worker deploy docker kubernetes cloud storage memory cpu disk network socket http json '
+         'schema migration test debug profile trace metric log alert dashboard release feature').split()
+
+# comment j of an article replies to comment j - 1, to an earlier one, or to the article
+REPLY_TO_PREVIOUS, REPLY_TO_EARLIER = 0.35, 0.25
+EDITOR_SHARE = 0.02
+STATUS_WEIGHTS = {'published': 85, 'draft': 10, 'archived': 5}
+DISLIKE_SHARE = 0.15
+# of every generated user
+PASSWORD = 'LoadTest123'
+
+
+def zipf_weights(count, exponent=1.07):
+    weights = [1 / rank ** exponent for rank in range(1, count + 1)]
+    total = sum(weights)
+    return [weight / total for weight in weights]
+
+
+def next_id(model):
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+class Generator:
+
+    def __init__(self, seed=1, days=365, batch_size=5000, stdout=None):
+        self.random = random.Random(seed)
+        self.days = days
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.counts = {}
+
+    def report(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def pick(self, cum_weights, population):
+        """One of `population`, drawn with the cumulative weights."""
+        return population[bisect.bisect(cum_weights, self.random.random() * cum_weights[-1])]
+
+    def rounded(self, value):
+        """`value` rounded up or down at random, keeping the expected sum."""
+        whole = int(value)
+        return whole + (self.random.random() < value - whole)
+
+    def sentence(self, length):
+        return ' '.join(self.random.choices(WORDS, cum_weights=self.word_weights, k=length))
+
+    def generate(self, users, articles, comments_per_article, likes_density, tags):
+        self.word_weights = list(itertools.accumulate(zipf_weights(len(WORDS))))
+        with transaction.atomic():
+            user_ids = self.create_users(users)
+            tag_ids = self.create_tags(tags)
+            self.create_articles(articles, user_ids, tag_ids, comments_per_article, likes_density)
+            self.reset_sequences()
+        get_search_backend().index()
+        trending.rebuild()
+        recount_tags()
+        invalidate_articles()
+        return self.counts
+
+    def create_users(self, count):
+        """
+        `count` users with profiles, all in the Users group and a few
+        editors (who write the articles). Returns the profile ids.
+        """
+        first, password = next_id(User), make_password(PASSWORD)
+        ids = range(first, first + count)
+        User.objects.bulk_create([User(id=i, username=f'load_user_{i}', password=password) for i in ids],
+                                 batch_size=self.batch_size)
+        profile_first = next_id(UserProfile)
+        UserProfile.objects.bulk_create([
+            UserProfile(id=profile_first + n, user_id=i) for n, i in enumerate(ids)
+        ], batch_size=self.batch_size)
+
+        users_group, _ = Group.objects.get_or_create(name='Users')
+        editors_group, _ = Group.objects.get_or_create(name='Editors')
+        editors = max(1, int(count * EDITOR_SHARE))
+        through = User.groups.through
+        through.objects.bulk_create(
+            [through(user_id=i, group=users_group) for i in ids]
+            + [through(user_id=i, group=editors_group) for i in ids[:editors]],
+            batch_size=self.batch_size,
+        )
+        self.counts['users'] = count
+        self.report(f'{count} users ({editors} editors)')
+        return list(range(profile_first, profile_first + count))
+
+    def create_tags(self, count):
+        first = next_id(Tag)
+        Tag.objects.bulk_create([Tag(id=first + n, name=f'{self.random.choice(WORDS)}-{first + n}')
+                                 for n in range(count)])
+        self.counts['tags'] = count
+        return list(range(first, first + count))
+
+    def create_articles(self, count, profile_ids, tag_ids, comments_per_article, likes_density):
+        editors = profile_ids[:max(1, int(len(profile_ids) * EDITOR_SHARE))]
+        editor_weights = list(itertools.accumulate(zipf_weights(len(editors))))
+        user_weights = list(itertools.accumulate(zipf_weights(len(profile_ids))))
+        tag_weights = list(itertools.accumulate(zipf_weights(len(tag_ids))))
+        statuses = list(STATUS_WEIGHTS)
+        status_weights = list(itertools.accumulate(STATUS_WEIGHTS.values()))
+
+        # popularity: a Zipf weight per article, spread over time at random
+        popularity = zipf_weights(count)
+        self.random.shuffle(popularity)
+        comment_total, like_total = count * comments_per_article, likes_density * count * len(profile_ids)
+
+        article_first, comment_first, like_first = next_id(Article), next_id(Comment), next_id(ArticleUserLikes)
+        comment_id, like_id = comment_first, like_first
+        days = {'article': [], 'comment': [], 'like': []}
+        self.counts.update(articles=0, comments=0, likes=0)
+
+        for start in range(0, count, self.batch_size):
+            articles, article_tags, comments, likes = [], [], [], []
+            for n in range(start, min(start + self.batch_size, count)):
+                article_id = article_first + n
+                day = n * self.days // count
+                likers = self.random.sample(profile_ids,
+                                            min(len(profile_ids), self.rounded(like_total * popularity[n])))
+                dislikes = sum(self.random.random() < DISLIKE_SHARE for _ in likers)
+
+                articles.append(Article(
+                    id=article_id,
+                    author_id=self.pick(editor_weights, editors),
+                    title=f'{self.sentence(self.random.randint(3, 7)).capitalize()} {article_id}',
+                    text=self.sentence(self.random.randint(30, 300)),
+                    status=self.pick(status_weights, statuses),
+                    like_count=len(likers) - dislikes,
+                    dislike_count=dislikes,
+                ))
+                article_tags += [
+                    Article.tags.through(article_id=article_id, tag_id=tag_id)
+                    for tag_id in {self.pick(tag_weights, tag_ids) for _ in range(self.random.randint(1, 4))}
+                ]
+                for number, user in enumerate(likers):
+                    likes.append(ArticleUserLikes(id=like_id, user_id=user, article_id=article_id,
+                                                  like_type='dislike' if number < dislikes else 'like'))
+                    like_id += 1
+
+                thread = []
+                for _ in range(self.rounded(comment_total * popularity[n])):
+                    chance = self.random.random()
+                    if thread and chance < REPLY_TO_PREVIOUS:
+                        reply_to = thread[-1]
+                    elif thread and chance < REPLY_TO_PREVIOUS + REPLY_TO_EARLIER:
+                        reply_to = self.random.choice(thread)
+                    else:
+                        reply_to = None
+                    comments.append(Comment(id=comment_id, article_id=article_id, reply_to_id=reply_to,
+                                            author_id=self.pick(user_weights, profile_ids),
+                                            text=self.sentence(self.random.randint(3, 30))[:200]))
+                    thread.append(comment_id)
+                    comment_id += 1
+
+                # ids grow with the days, a day is a range of ids in every table
+                for table, last_id in (('article', article_id), ('comment', comment_id - 1), ('like', like_id - 1)):
+                    if not days[table] or days[table][-1][0] != day:
+                        days[table].append([day, last_id])
+                    days[table][-1][1] = last_id
+
+            Article.objects.bulk_create(articles)
+            Article.tags.through.objects.bulk_create(article_tags)
+            Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+            ArticleUserLikes.objects.bulk_create(likes, batch_size=self.batch_size)
+            self.counts['articles'] += len(articles)
+            self.counts['comments'] += len(comments)
+            self.counts['likes'] += len(likes)
+            self.report(f'{self.counts["articles"]} articles, {self.counts["comments"]} comments, '
+                        f'{self.counts["likes"]} likes')
+
+        self.spread_dates(Article, article_first, days['article'])
+        self.spread_dates(Comment, comment_first, days['comment'])
+        self.spread_dates(ArticleUserLikes, like_first, days['like'])
+
+    def spread_dates(self, model, first_id, days):
+        now = timezone.now()
+        previous = first_id - 1
+        for day, last_id in days:
+            if last_id > previous:
+                moment = now - timedelta(days=self.days - day)
+                model.objects.filter(id__gt=previous, id__lte=last_id).update(created_at=moment, updated_at=moment)
+                previous = last_id
+
+    @staticmethod
+    def reset_sequences():
+        # PostgreSQL sequences do not follow explicit ids (SQLite's do)
+        models = [User, UserProfile, Tag, Article, Comment, ArticleUserLikes]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+
+def generate(users=1000, articles=10_000, comments_per_article=5, likes_density=0.01, tags=100,
+             seed=1, days=365, batch_size=5000, stdout=None):
+    """
+    Generate the data set and return the row counts.
+    """
+    return Generator(seed, days, batch_size, stdout).generate(users, articles, comments_per_article,
+                                                              likes_density, tags)
@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
+
+from .models import Comment
+
+# upper bound of the replies loaded for one page of a comment tree
+MAX_TREE_NODES = 5000
+
+# the replies below the given comments, breadth first, in one recursive query;
+# at most %s of them (the shallowest) per given comment, so that every comment
+# of the page gets its share (what is left out shows as more_replies)
+DESCENDANTS_SQL = """
+    WITH RECURSIVE thread(id, root, depth) AS (
+        SELECT id, reply_to_id, 1 FROM api_comment WHERE reply_to_id IN ({roots})
+        UNION ALL
+        SELECT c.id, thread.root, thread.depth + 1
+        FROM api_comment c JOIN thread ON c.reply_to_id = thread.id
+        WHERE thread.depth < %s
+    ),
+    ranked AS (
+        SELECT c.*, thread.depth AS depth,
+               ROW_NUMBER() OVER (PARTITION BY thread.root ORDER BY thread.depth, c.created_at, c.id) AS position
+        FROM thread JOIN api_comment c ON c.id = thread.id
+    )
+    SELECT ranked.*, (SELECT COUNT(*) FROM api_comment r WHERE r.reply_to_id = ranked.id) AS reply_count
+    FROM ranked
+    WHERE position <= %s
+    ORDER BY depth, created_at, id
+"""
+
+
+# 1 if comment %s is comment %s or one of the comments it replies to; UNION
+# (not UNION ALL) stops at a cycle already in the table
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors(id) AS (
+        SELECT %s
+        UNION
+        SELECT c.reply_to_id FROM api_comment c JOIN ancestors ON c.id = ancestors.id
+        WHERE c.reply_to_id IS NOT NULL
+    )
+    SELECT 1 FROM ancestors WHERE id = %s
+"""
+
+
+def in_thread_of(comment, reply_to):
+    """
+    Whether `reply_to` is `comment` or one of its replies (at any depth):
+    `comment` replying to it would close a cycle.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(ANCESTORS_SQL, [reply_to.pk, comment.pk])
+        return cursor.fetchone() is not None
+
+
+def load_descendants(comments, max_depth, max_nodes):
+    """
+    The replies (and replies to replies...) of `comments`, down to
+    `max_depth` levels and at most `max_nodes` of them, shallow levels
+    first and shared evenly between the comments. Every comment gets
+    `depth` and `reply_count` attributes.
+    """
+    ids = [comment.id for comment in comments]
+    if not ids or max_depth < 1:
+        return []
+    sql = DESCENDANTS_SQL.format(roots=', '.join(['%s'] * len(ids)))
+    return list(Comment.objects.raw(sql, [*ids, max_depth, max(1, max_nodes // len(ids))]))
+
+
+def bounded_int(params, name, default, maximum=None):
+    """
+    An integer query parameter, capped at `maximum`.
+    """
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: ['A valid integer is required.']})
+    if value < 0:
+        raise ValidationError({name: ['Must not be negative.']})
+    return value if maximum is None else min(value, maximum)
+
+
+def boolean(params, name, default=False):
+    """
+    A boolean query parameter: 1/true/yes/on or 0/false/no/off.
+    """
+    value = params.get(name)
+    if not value:
+        return default
+    if value in BooleanField.TRUE_VALUES:
+        return True
+    if value in BooleanField.FALSE_VALUES:
+        return False
+    raise ValidationError({name: ['Must be a valid boolean.']})
+
+
+def build_tree(comments, descendants, serialize, replies_per_level):
+    """
+    Nest `descendants` under `comments` in one pass (O(n)). Every node is
+    the serialized comment plus its `depth` below the page, `reply_count`
+    and its first `replies_per_level` `replies`; `more_replies` tells the
+    client to page the rest with ?parent=<id>.
+    """
+    included = {comment.id: comment for comment in comments}
+    children = defaultdict(list)
+    for comment in descendants:
+        # replies below a reply that did not make the cut are dropped too
+        siblings = children[comment.reply_to_id]
+        if comment.reply_to_id in included and len(siblings) < replies_per_level:
+            included[comment.id] = comment
+            siblings.append(comment)
+
+    data = dict(zip(included, serialize(list(included.values()))))
+
+    def node(comment, depth):
+        replies = [node(child, depth + 1) for child in children[comment.id]]
+        return {
+            **data[comment.id],
+            'depth': depth,
+            'reply_count': comment.reply_count,
+            'replies': replies,
+            'more_replies': len(replies) < comment.reply_count,
+        }
+
+    return [node(comment, 0) for comment in comments]
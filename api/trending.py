@@ -0,0 +1,120 @@
+"""
+The trending articles: a score per article (ArticleScore) of its likes
+and comments, each worth half as much every API_TRENDING_HALF_LIFE_HOURS.
+
+Scores are not computed when the feed is read:
+
+- every like and comment adds its weight to the score of its article as
+  it happens (api.signals), and takes it back when it goes away;
+- the decay job (`python manage.py decay_trending`, from cron) decays
+  every score at once and drops the ones that fell below MIN_SCORE. The
+  likes and comments since the previous run count as if they happened at
+  that run, so the scores always compare;
+- `python manage.py rebuild_trending` computes them again from the likes
+  and comments (after bulk writes, which send no signals, and repairs).
+
+The feed is then the highest scores, read from the api_score_idx index.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import ArticleScore, ArticleUserLikes, Comment
+
+# what a like and a comment add to the score of their article
+WEIGHTS = {'like': 1.0, 'comment': 2.0}
+# below this (a like more than four half-lives ago), an article is no longer trending
+MIN_SCORE = 0.05
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'API_TRENDING_HALF_LIFE_HOURS', 24))
+
+
+def decay_factor(elapsed):
+    return 0.5 ** (elapsed / half_life())
+
+
+def last_decay():
+    """When the decay job last ran, None before the first run"""
+    return ArticleScore.objects.aggregate(last=Max('decayed_at'))['last']
+
+
+def bump(article_id, weight):
+    """
+    Add `weight` to the score of the article (take it back when negative),
+    in the UPDATE itself: concurrent likes and comments all count.
+    """
+    scores = ArticleScore.objects.filter(article_id=article_id)
+    if scores.update(score=Greatest(F('score') + weight, 0.0)) or weight <= 0:
+        return
+    try:
+        with transaction.atomic():
+            ArticleScore.objects.create(article_id=article_id, score=weight)
+    except IntegrityError:
+        # created by a concurrent request meanwhile
+        scores.update(score=F('score') + weight)
+
+
+def decay(now=None):
+    """
+    Decay every score to `now`, drop the ones below MIN_SCORE. Returns the
+    number of scores left and dropped.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        last = last_decay()
+        factor = decay_factor(now - last) if last else 1.0
+        kept = ArticleScore.objects.update(score=F('score') * factor, decayed_at=now)
+        dropped, _ = ArticleScore.objects.filter(score__lt=MIN_SCORE).delete()
+    return kept - dropped, dropped
+
+
+def compute_scores(article_ids=None, at=None):
+    """
+    The scores of the given articles (every article: None) as of `at`,
+    from their likes and comments; the older than ten half-lives no
+    longer count.
+    """
+    at = at or timezone.now()
+    events = [
+        (ArticleUserLikes.objects.filter(like_type='like'), WEIGHTS['like']),
+        (Comment.objects.all(), WEIGHTS['comment']),
+    ]
+    scores = defaultdict(float)
+    for queryset, weight in events:
+        queryset = queryset.filter(created_at__gte=at - 10 * half_life())
+        if article_ids is not None:
+            queryset = queryset.filter(article_id__in=article_ids)
+        for article_id, created_at in queryset.values_list('article_id', 'created_at').iterator():
+            # what happened since `at` counts in full, like with bump()
+            scores[article_id] += weight * decay_factor(max(at - created_at, timedelta(0)))
+    return scores
+
+
+def rebuild(article_ids=None):
+    """
+    Replace the scores of the given articles (every article: None) with
+    the ones computed from their likes and comments. Returns how many
+    articles are trending.
+    """
+    with transaction.atomic():
+        # a full rebuild is a decay run of its own, the others keep up with the last run
+        now = timezone.now()
+        decayed_at = now if article_ids is None else last_decay()
+        scores = compute_scores(article_ids, at=decayed_at or now)
+
+        stale = ArticleScore.objects.all()
+        if article_ids is not None:
+            stale = stale.filter(article_id__in=list(article_ids))
+        stale.delete()
+        ArticleScore.objects.bulk_create([
+            ArticleScore(article_id=article_id, score=score, decayed_at=decayed_at)
+            for article_id, score in scores.items() if score >= MIN_SCORE
+        ], batch_size=1000)
+    return ArticleScore.objects.count()
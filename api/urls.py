@@ -1,8 +1,9 @@
 from rest_framework.routers import DefaultRouter
-from django.urls import path, include
+from django.urls import path, include, re_path
 from .views import (CommentViewSet, ArticleViewSet, ArticleUserLikesViewSet,
-                    UserProfileViewSet, UserViewSet, TagViewSet, AuthViewSet
+                    UserProfileViewSet, UserViewSet, TagViewSet, AuthViewSet, MetricsView, HealthView
                     )
+from .async_views import article_comments, article_detail, article_list, async_view, auth_check
 
 
 router = DefaultRouter()
@@ -23,4 +24,23 @@ urlpatterns = router.urls
 urlpatterns += [
     path('register/', AuthViewSet.as_view({'post': 'register'}), name='register'),
     path('login/', AuthViewSet.as_view({'post': 'login'}), name='login'),
-]
\ No newline at end of file
+    path('_metrics', MetricsView.as_view(), name='metrics'),
+    path('_health', HealthView.as_view(), name='health'),
+]
+
+# the async views of the hot reads, in front of the routes above in an ASGI
+# deployment (final/urls_async.py, see api.async_views); same names, and the
+# requests they do not answer go to the regular views
+views = {pattern.name: pattern.callback for pattern in urlpatterns}
+
+async_urlpatterns = [
+    re_path(r'^articles/$', async_view(article_list, views['articles-list'], delegated=['search']),
+            name='articles-list'),
+    # digits: the list actions (export/, trending/, ...) are not articles
+    re_path(r'^articles/(?P<pk>[0-9]+)/$', async_view(article_detail, views['articles-detail']),
+            name='articles-detail'),
+    re_path(r'^articles/(?P<pk>[0-9]+)/comments/$',
+            async_view(article_comments, views['articles-comments'], delegated=['tree']),
+            name='articles-comments'),
+    re_path(r'^auth/auth/$', async_view(auth_check, views['auth-auth']), name='auth-auth'),
+]
@@ -1,26 +1,68 @@
 
 
+import logging
+
 from rest_framework.response import Response
 from core.auth import get_token_for_user
 from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.serializers import AuthTokenSerializer
-from rest_framework import filters
 
 from rest_framework.permissions import AllowAny
 from rest_framework.viewsets import ModelViewSet
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.db import DatabaseError, connections
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from .serialiazers import (ArticleSerializer, ArticleUserLikesSerializer, UserSerializer, UserProfileSerializer,
-                           CommentSerializer,
+                           CommentSerializer, ArticleValuesSerializer, CommentValuesSerializer,
                            TagSerializer)
 
-from .models import Article, ArticleUserLikes, Tag, UserProfile, Article, Comment, ArticleUserLikes
+from .pagination import KeysetPagination, CommentPagination
+from .bulk import BulkMixin
+from .conditional import ConditionalGetMixin
+from .export import FORMATS, RESOURCES, export_chunks
+from .caching import cached_response, comments_namespace, detail_namespace, invalidate_articles, list_namespace, stats
+from .filters import ArticleSearchFilter, ArticleTagFilter
+from .log import fields, lazy
+from .profiling import metrics
+from .search import get_search_backend
+from .signals import recount_likes, recount_tags
+from .threads import MAX_TREE_NODES, boolean, bounded_int, build_tree, load_descendants
+from . import trending
+from .models import Article, ArticleUserLikes, Tag, UserProfile, Article, Comment, ArticleUserLikes, STATUS_CHOICES
 
 #from rest_framework.permissions import IsAdminUser
 
 from .permissions import (CommentOwnerOrReadOnly, ArticlesPermission, IsAdmin,
                           TagsPermission, UserLikesPermission, UserProfilePermission,
-                          IsEditorOrAdmin, IsUserOrEditorOrAdmin)
+                          IsEditorOrAdmin, IsUserOrEditorOrAdmin, get_roles, has_role)
+
+logger = logging.getLogger(__name__)
+
+
+class ValuesListMixin:
+    """
+    GET lists render `.values()` rows with `values_serializer_class`
+    instead of serializing model instances. The rows are fetched after
+    filtering, so search and ETags still work on the model queryset.
+    """
+    values_serializer_class = None
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return self.values_serializer_class
+        return super().get_serializer_class()
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list':
+            queryset = self.values_serializer_class.values(queryset)
+        return super().paginate_queryset(queryset)
 
 
 class UserViewSet(ModelViewSet):
@@ -29,79 +71,256 @@ class UserViewSet(ModelViewSet):
     permission_classes = [IsAdmin]
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(BulkMixin, ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [TagsPermission]
 
+    @action(detail=False, methods=['get'])
+    def cloud(self, request):
+        """
+        The tags of the published articles, most used first, by their
+        precomputed counts: ?limit=, 50 by default.
+        """
+        limit = bounded_int(request.query_params, 'limit', default=50, maximum=500)
+        tags = Tag.objects.filter(article_count__gt=0).order_by('-article_count', 'name')
+        return Response(list(tags.values('id', 'name', 'article_count')[:limit]))
+
+    def bulk_written(self, instances, created):
+        if not created:
+            # renamed tags change the search documents of their articles
+            article_ids = list(Article.tags.through.objects.filter(tag__in=instances)
+                               .values_list('article_id', flat=True).distinct())
+            get_search_backend().index(article_ids)
+            invalidate_articles(article_ids)
+
 
-class ArticleUserLikesViewSet(ModelViewSet):
+class ArticleUserLikesViewSet(ConditionalGetMixin, BulkMixin, ModelViewSet):
     queryset = ArticleUserLikes.objects.all()
     serializer_class = ArticleUserLikesSerializer
     permission_classes = [UserLikesPermission]
+    pagination_class = KeysetPagination
 
+    def get_queryset(self):
+        if self.action == 'bulk':
+            # UserLikesPermission compares the owner of every like
+            return self.queryset.select_related('user__user')
+        return self.queryset.all()
 
-class ArticleViewSet(ModelViewSet):
+    def bulk_written(self, instances, created):
+        article_ids = {instance.article_id for instance in instances}
+        if not created:
+            # likes moved to another article leave their old one behind
+            article_ids.update(instance._loaded['article_id'] for instance in instances)
+        recount_likes(article_ids)
+        trending.rebuild(article_ids)
+
+
+class ArticleViewSet(ConditionalGetMixin, ValuesListMixin, BulkMixin, ModelViewSet):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
+    values_serializer_class = ArticleValuesSerializer
     permission_classes = [ArticlesPermission]
-    filter_backends = [filters.SearchFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [ArticleTagFilter, ArticleSearchFilter]
     search_fields = ['title', 'text', 'tags__name']
+
+    def get_queryset(self):
+        """
+        Build the queryset for the current action, eager-loading only what
+        the serializer (or the action itself) is going to touch.
+        """
+        queryset = self.get_status_queryset()
+
+        if self.action in ('retrieve', 'create', 'update', 'partial_update', 'bulk'):
+            # the serializer renders the tags m2m as a list of ids (the list
+            # aggregates them in SQL, see ArticleValuesSerializer):
+            return queryset.prefetch_related('tags')
+
+        if self.action == 'comments':
+            # only the article itself is needed, __str__ follows author.user:
+            return queryset.select_related('author__user')
+
+        return queryset
+
+    def get_status_queryset(self):
+        """
+        Readers only ever see the published articles, and their own drafts
+        and archived ones outside of the list. Editors see every status;
+        their list stays on the published ones unless ?status= asks for
+        draft, archived or all.
+        """
+        if not has_role(self.request, 'Editors', 'Admin'):
+            if self.action == 'list' or not self.request.user.is_authenticated:
+                return Article.published.all()
+            return Article.objects.filter(Q(status='published') | Q(author__user=self.request.user))
+        if self.action != 'list':
+            return Article.objects.all()
+
+        status = self.request.query_params.get('status', 'published')
+        if status == 'all':
+            return Article.objects.all()
+        if status not in dict(STATUS_CHOICES):
+            choices = ', '.join([*dict(STATUS_CHOICES), 'all'])
+            raise ValidationError({'status': [f'Must be one of {choices}.']})
+        return Article.objects.with_status(status)
+
+    def bulk_written(self, instances, created):
+        article_ids = [instance.pk for instance in instances]
+        get_search_backend().index(article_ids)
+        invalidate_articles(article_ids)
+        # the tags replaced are gone, count every tag
+        recount_tags()
+
+    @action(detail=False, methods=['get'], permission_classes=[IsEditorOrAdmin])
+    def export(self, request):
+        """
+        Every article (of any status) with its comments and like counts,
+        streamed: ?output=ndjson|csv, ?resource=articles|comments (CSV),
+        ?after=<article id> to resume; gzipped when the client accepts it.
+        """
+        params = request.query_params
+        output = params.get('output', 'ndjson')
+        resource = params.get('resource', 'articles')
+        if output not in FORMATS:
+            raise ValidationError({'output': [f'Must be one of {", ".join(FORMATS)}.']})
+        if resource not in RESOURCES:
+            raise ValidationError({'resource': [f'Must be one of {", ".join(RESOURCES)}.']})
+        after = bounded_int(params, 'after', default=0)
+        gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+
+        response = StreamingHttpResponse(export_chunks(output, resource, after, gzip=gzip),
+                                         content_type=FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{output}"'
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    # anonymous reads are served from the cache (see api/caching.py):
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, list_namespace(),
+                               lambda: super(ArticleViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, detail_namespace(kwargs['pk']),
+                               lambda: super(ArticleViewSet, self).retrieve(request, *args, **kwargs))
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """
+        The published articles with the most recent likes and comments, by
+        their precomputed score (see api/trending.py): ?limit=, 20 by default.
+        """
+        limit = bounded_int(request.query_params, 'limit', default=settings.API_PAGE_SIZE, maximum=100)
+        # the (always true) range on the score has the query walk api_score_idx, highest first,
+        # rather than sort every published article
+        articles = Article.published.filter(trending__score__gte=0) \
+            .order_by('-trending__score', '-trending__article_id')
+        rows = ArticleValuesSerializer.values(articles).annotate(trending_score=F('trending__score'))[:limit]
+        return Response(ArticleValuesSerializer(rows, many=True).data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def cache_stats(self, request):
+        """Hits and misses of the article response cache in this process"""
+        return Response(dict(stats))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        # add the highlighted snippets of a search, for this page only:
+        terms = ArticleSearchFilter().get_search_terms(self.request)
+        if page is not None and terms:
+            get_search_backend().highlight(page, terms)
+        return page
     
     def create(self, request, *args, **kwargs):
-        print(f"DEBUG: Creating article with data: {request.data}")
-        print(f"DEBUG: User: {request.user}")
-        print(f"DEBUG: User profile: {getattr(request.user, 'userprofile', 'No profile')}")
+        logger.debug('Creating article', extra=fields(user=request.user.username,
+                                                      data=lazy(lambda: request.data)))
         return super().create(request, *args, **kwargs)
     
     @action(detail=True, methods=['get', 'post'])
     def comments(self, request, pk=None):
-        print(f"DEBUG: Comments endpoint called by user: {request.user}")
-        print(f"DEBUG: User authenticated: {request.user.is_authenticated}")
-        print(f"DEBUG: User groups: {list(request.user.groups.values_list('name', flat=True))}")
-        
-        article = self.get_object()
+        logger.debug('Comments of article %s', pk, extra=fields(
+            method=request.method, user=request.user.username,
+            roles=lazy(lambda: sorted(get_roles(request.user, request.auth))),
+        ))
+
         if request.method == 'GET':
-            comments = Comment.objects.filter(article=article)
-            serializer = CommentSerializer(comments, many=True)
-            return Response(serializer.data)
-        elif request.method == 'POST':
+            return cached_response(request, comments_namespace(pk),
+                                   lambda: self.conditional_comments(request, self.get_object()))
+
+        article = self.get_object()
+        if request.method == 'POST':
             # Check permissions manually
-            print(f"DEBUG: User authenticated: {request.user.is_authenticated}")
-            print(f"DEBUG: User: {request.user}")
-            print(f"DEBUG: User groups: {list(request.user.groups.values_list('name', flat=True))}")
-            
             if not request.user.is_authenticated:
                 return Response({'error': 'Authentication required'}, status=401)
             
-            if not (request.user.is_superuser or 
-                   request.user.groups.filter(name__in=['Users', 'Editors', 'Admin']).exists()):
+            if not has_role(request, 'Users', 'Editors', 'Admin'):
                 return Response({'error': 'Permission denied'}, status=403)
-            
-            print(f"DEBUG: Comment data: {request.data}")
-            print(f"DEBUG: Article: {article}")
-            print(f"DEBUG: User profile: {request.user.userprofile}")
-            
-            serializer = CommentSerializer(data=request.data, context={'request': request})
+
+            serializer = CommentSerializer(data=request.data, context={'request': request, 'article': article})
             if serializer.is_valid():
-                print(f"DEBUG: Serializer is valid, saving...")
+                reply_to = serializer.validated_data.get('reply_to')
                 serializer.save(article=article, author=request.user.userprofile)
+                logger.debug('Comment created', extra=fields(article=article.id, comment=serializer.instance.id,
+                                                             reply_to=reply_to and reply_to.id))
                 return Response(serializer.data, status=201)
             else:
-                print(f"DEBUG: Serializer errors: {serializer.errors}")
+                logger.debug('Invalid comment', extra=fields(article=article.id,
+                                                             errors=lazy(lambda: serializer.errors)))
                 return Response(serializer.errors, status=400)
 
+    def conditional_comments(self, request, article):
+        comments = Comment.objects.filter(article=article)
+        state = self.list_state(comments)
+        etag = self.make_etag(request.get_full_path(), *state.values())
+        return self.conditional(request, etag, None, lambda: self.list_comments(request, comments))
+
+    def list_comments(self, request, comments):
+        # the article paginator orders newest first, comments read oldest first:
+        paginator = CommentPagination()
+        if boolean(request.query_params, 'tree'):
+            return self.comment_tree(request, comments, paginator)
+        page = paginator.paginate_queryset(CommentValuesSerializer.values(comments), request, view=self)
+        serializer = CommentValuesSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def comment_tree(self, request, comments, paginator):
+        """
+        ?tree=1: the top level comments (or the replies of ?parent=<id>), a
+        page at a time, each with its replies nested ?depth= levels deep and
+        at most ?replies= of them per comment.
+        """
+        params = request.query_params
+        max_depth = bounded_int(params, 'depth', default=3, maximum=10)
+        replies_per_level = bounded_int(params, 'replies', default=5, maximum=100)
+        parent = bounded_int(params, 'parent', default=None)
+
+        comments = comments.filter(reply_to=parent).annotate(reply_count=Coalesce(Subquery(
+            Comment.objects.filter(reply_to=OuterRef('pk')).values('reply_to')
+            .annotate(count=Count('id')).values('count')
+        ), 0))
+        page = paginator.paginate_queryset(comments, request, view=self)
+        shown = len(page) * sum(replies_per_level ** level for level in range(1, max_depth + 1))
+        descendants = load_descendants(page, max_depth, max_nodes=min(shown, MAX_TREE_NODES))
+
+        tree = build_tree(page, descendants, lambda items: CommentSerializer(items, many=True).data,
+                          replies_per_level)
+        return paginator.get_paginated_response(tree)
 
-class UserProfileViewSet(ModelViewSet):
+
+class UserProfileViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [UserProfilePermission]
 
 
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(ConditionalGetMixin, ValuesListMixin, ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    values_serializer_class = CommentValuesSerializer
     permission_classes = [CommentOwnerOrReadOnly]
+    pagination_class = CommentPagination
     
     def get_permissions(self):
         """
@@ -131,7 +350,6 @@ class AuthViewSet(ViewSet):
         serializer.is_valid(raise_exception=True)
 
         user = serializer.save()  # calls the create method
-        jwt = get_token_for_user(user)
 
         # יוצר פרופיל למשתמש אוטומטית בעת ההרשמה
         UserProfile.objects.get_or_create(user = user)
@@ -140,6 +358,9 @@ class AuthViewSet(ViewSet):
         from django.contrib.auth.models import Group
         users_group, created = Group.objects.get_or_create(name='Users')
         user.groups.add(users_group)
+
+        # after the group, the token may carry it as a roles claim:
+        jwt = get_token_for_user(user)
         
         return Response({'message': 'Registered successfully', 'user':serializer.data, **jwt})
 
@@ -174,4 +395,35 @@ class AuthViewSet(ViewSet):
         """Check if user is authenticated"""
         if request.user.is_authenticated:
             return Response({'authenticated': True, 'user': request.user.username})
-        return Response({'authenticated': False}, status=401)
\ No newline at end of file
+        return Response({'authenticated': False}, status=401)
+
+
+class MetricsView(APIView):
+    """
+    The request totals of api.profiling and the response cache counters
+    of this process, in the Prometheus text format.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class HealthView(APIView):
+    """
+    Whether every database answers, for load balancers: 200, or 503 with
+    the error of the failing ones. Open to anyone, tokens are not read.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        databases, healthy = {}, True
+        for alias in connections:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                databases[alias] = 'ok'
+            except DatabaseError as exc:
+                databases[alias], healthy = f'error: {exc}', False
+        return Response({'databases': databases}, status=200 if healthy else 503)
@@ -1,5 +1,8 @@
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
+from django.conf import settings
+
+from api.permissions import get_roles
 
 class BlogTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -8,6 +11,9 @@ class BlogTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         # Add custom claims
         token['isadmin'] = user.is_superuser
+        if getattr(settings, 'JWT_ROLES_CLAIM', False):
+            # the group names, trusted by api.permissions.get_roles until the token expires
+            token['roles'] = sorted(get_roles(user))
         # ...
 
         return token
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'final.settings')
+# every async request runs its queries in a thread of its own, a connection
+# kept open would be left behind with the thread (pool them with DB_POOL_MAX_SIZE)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
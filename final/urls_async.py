@@ -0,0 +1,14 @@
+"""
+URL configuration of the requests served async (ASGI): the async views of
+api.async_views in front of the regular routes. Set per request by
+api.async_views.AsyncRoutesMiddleware.
+"""
+from django.urls import path, include
+
+from api.urls import async_urlpatterns
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include(async_urlpatterns)),
+    *sync_urlpatterns,
+]